@@ -0,0 +1,94 @@
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for an external dependency.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    `allow_request()` returns False until `reset_timeout` seconds have
+    passed. It then lets a single probe through (half-open); a success
+    closes it again, a failure re-opens it.
+
+    Callers run on the event loop, so no locking is needed.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0, history_size: int = 20):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self.total_failures = 0
+        self.total_successes = 0
+        self.total_rejected = 0
+        self.transitions: deque[dict] = deque(maxlen=history_size)
+        self._probe_in_flight = False
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"Circuit breaker '{self.name}' {self.state} -> {state}")
+        self.transitions.append({"from_state": self.state, "to_state": state, "at": time.time()})
+        self.state = state
+
+    def allow_request(self) -> bool:
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._transition(HALF_OPEN)
+
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+
+        self.total_rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        self.total_successes += 1
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        self.opened_at = None
+        self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        self.total_failures += 1
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._transition(OPEN)
+
+    def record_cancelled(self) -> None:
+        """The call was cancelled before it finished: count nothing, but free the half-open probe slot."""
+        self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        retry_in = None
+        if self.state == OPEN and self.opened_at is not None:
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "retry_in": retry_in,
+            "total_failures": self.total_failures,
+            "total_successes": self.total_successes,
+            "total_rejected": self.total_rejected,
+            "transitions": list(self.transitions),
+        }
@@ -1,5 +1,6 @@
-from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy import create_engine, delete, event, inspect, select, text, update
 from sqlalchemy.orm import sessionmaker, declarative_base
+import logging
 import os
 
 # Store DB file in the backend directory
@@ -27,3 +28,88 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def ensure_columns():
+    """Add nullable columns declared on models but missing from existing tables."""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+
+def _group_ids(connection, table, key_columns: list[str], *criteria) -> list[list[int]]:
+    """Ids of rows sharing a value for every key column (NULLs never match), one list per group of two or more."""
+    query = select(table.c.id, *(table.c[name] for name in key_columns)).where(
+        *criteria, *(table.c[name].is_not(None) for name in key_columns)
+    )
+    groups: dict[tuple, list[int]] = {}
+    for row in connection.execute(query):
+        groups.setdefault(tuple(row[1:]), []).append(row[0])
+    return [ids for ids in groups.values() if len(ids) > 1]
+
+
+def merge_rows(connection, table, keep: int, dropped: list[int]) -> None:
+    """Fold `dropped` rows of `table` into `keep`: repoint foreign keys at it, then delete them.
+
+    Referencing rows that would then collide on a unique index are merged
+    the same way first (newest wins), e.g. two merged locations' forecasts
+    for the same date.
+    """
+    if not dropped:
+        return
+    for referrer in Base.metadata.sorted_tables:
+        for foreign_key in referrer.foreign_keys:
+            if foreign_key.column.table is not table:
+                continue
+            column = foreign_key.parent.name
+            for index in referrer.indexes:
+                index_columns = [c.name for c in index.columns]
+                if not index.unique or column not in index_columns:
+                    continue
+                others = [name for name in index_columns if name != column]
+                for ids in _group_ids(connection, referrer, others, referrer.c[column].in_([keep, *dropped])):
+                    newest = max(ids)
+                    merge_rows(connection, referrer, newest, [row_id for row_id in ids if row_id != newest])
+            connection.execute(update(referrer).where(referrer.c[column].in_(dropped)).values({column: keep}))
+    connection.execute(delete(table).where(table.c.id.in_(dropped)))
+
+
+def _merge_duplicate_rows(connection, table, index) -> int:
+    """Collapse rows that would break a unique index into the newest (highest id) of each group."""
+    merged = 0
+    for ids in _group_ids(connection, table, [column.name for column in index.columns]):
+        keep = max(ids)
+        merge_rows(connection, table, keep, [row_id for row_id in ids if row_id != keep])
+        merged += len(ids) - 1
+    return merged
+
+
+def ensure_indexes():
+    """Create model indexes missing from tables that existed before the index was declared.
+
+    `create_all` skips existing tables entirely, so indexes added later would
+    otherwise only appear on fresh databases. Before a unique index is added,
+    rows that would violate it are merged into the newest one. Any remaining
+    failure stops startup: upserts rely on these indexes.
+    """
+    logger = logging.getLogger(__name__)
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            with engine.begin() as connection:
+                if index.unique:
+                    merged = _merge_duplicate_rows(connection, table, index)
+                    if merged:
+                        logger.warning(f"Merged {merged} duplicate {table.name} rows before creating {index.name}")
+                index.create(bind=connection)
@@ -0,0 +1,77 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCATION = "us-central1"
+
+
+class GenAIClientProvider:
+    """One google-genai Vertex AI client shared by every Gemini/Imagen call.
+
+    Building a client does credential discovery and sets up its own HTTP
+    transport, so it is created once per process and reused. Pass a `client`
+    (anything with `.aio.models`) to stub all model calls in tests, then
+    install it with `set_genai_clients`.
+    """
+
+    def __init__(self, client=None, project: str | None = None, location: str | None = None):
+        self._client = client
+        self._owns_client = client is None
+        self._project = project
+        self._location = location
+
+    @property
+    def client(self):
+        return self.open()
+
+    @property
+    def models(self):
+        """Async model API (`generate_content`, `generate_images`, ...)."""
+        return self.client.aio.models
+
+    def open(self):
+        """Create the client if needed. Raises ValueError when no Google Cloud project is configured."""
+        if self._client is None:
+            project = self._project or os.environ.get("GOOGLE_CLOUD_PROJECT")
+            if not project:
+                raise ValueError("GOOGLE_CLOUD_PROJECT environment variable is missing.")
+
+            from google import genai
+
+            self._client = genai.Client(
+                vertexai=True,
+                project=project,
+                location=self._location or os.environ.get("GOOGLE_CLOUD_LOCATION", DEFAULT_LOCATION),
+            )
+        return self._client
+
+    def warm(self) -> None:
+        """Create the client at startup so the first request doesn't pay for it. Failures are left for that request to report."""
+        try:
+            self.open()
+        except Exception as exc:
+            logger.warning(f"Gemini client not initialised at startup: {exc}")
+
+    async def aclose(self) -> None:
+        # A client passed in by the caller is theirs to close
+        if self._client is None or not self._owns_client:
+            return
+        aclose = getattr(self._client.aio, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        self._client = None
+
+
+_provider = GenAIClientProvider()
+
+
+def get_genai_clients() -> GenAIClientProvider:
+    return _provider
+
+
+def set_genai_clients(provider: GenAIClientProvider) -> GenAIClientProvider:
+    """Replace the shared provider and return the previous one."""
+    global _provider
+    previous, _provider = _provider, provider
+    return previous
@@ -14,6 +14,8 @@ class GeneratedOutfit(Base):
     top_description = Column(String, nullable=False)
     bottom_description = Column(String, nullable=False)
     image_url = Column(String, nullable=True)
+    thumbnail_url = Column(String, nullable=True)
+    medium_url = Column(String, nullable=True)
     llm_model_used = Column(String, nullable=False)
     prompt_used = Column(String, nullable=False)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
@@ -9,6 +9,8 @@ class GeneratedOutfitResponse(BaseModel):
     top_description: str
     bottom_description: str
     image_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    medium_url: Optional[str] = None
     created_at: datetime
 
     class Config:
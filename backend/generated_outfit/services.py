@@ -10,6 +10,8 @@ def create_generated_outfit(
     top_description: str,
     bottom_description: str,
     image_url: str | None,
+    thumbnail_url: str | None = None,
+    medium_url: str | None = None,
     llm_model_used: str,
     prompt_used: str,
 ) -> GeneratedOutfit:
@@ -18,6 +20,8 @@ def create_generated_outfit(
         top_description=top_description,
         bottom_description=bottom_description,
         image_url=image_url,
+        thumbnail_url=thumbnail_url,
+        medium_url=medium_url,
         llm_model_used=llm_model_used,
         prompt_used=prompt_used,
     )
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+@dataclass(frozen=True)
+class ServicePolicy:
+    timeout: float
+    retries: int = 0
+    backoff: float = 0.2
+
+
+# The weather breaker already handles sustained outages, so it only gets one quick retry.
+DEFAULT_POLICIES = {
+    "geocoding": ServicePolicy(timeout=10.0, retries=2, backoff=0.2),
+    "weather": ServicePolicy(timeout=10.0, retries=1, backoff=0.2),
+    "places": ServicePolicy(timeout=15.0, retries=2, backoff=0.3),
+}
+
+
+class HttpClientRegistry:
+    """One pooled AsyncClient shared by every Google REST integration.
+
+    Pass a `transport` (e.g. `httpx.MockTransport`) to stub all outbound
+    calls in tests, then install it with `set_http_clients`.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport | None = None, policies: dict[str, ServicePolicy] | None = None):
+        self._transport = transport
+        self.policies = {**DEFAULT_POLICIES, **(policies or {})}
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self.open()
+
+    def open(self) -> httpx.AsyncClient:
+        """Create the pooled client if needed. Called at startup so the first request doesn't pay for it."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0),
+                timeout=10.0,
+                transport=self._transport,
+            )
+        return self._client
+
+    async def request(self, service: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request using the service's timeout, retrying transport errors and 429/5xx with backoff."""
+        policy = self.policies[service]
+        timeout = httpx.Timeout(policy.timeout, connect=min(policy.timeout, 5.0))
+
+        for attempt in range(policy.retries + 1):
+            last_attempt = attempt == policy.retries
+            try:
+                response = await self.client.request(method, url, timeout=timeout, **kwargs)
+            except httpx.TransportError as exc:
+                if last_attempt:
+                    raise
+                logger.info(f"{service} request failed ({exc!r}), retrying")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                    return response
+                logger.info(f"{service} request returned {response.status_code}, retrying")
+
+            await asyncio.sleep(policy.backoff * (2 ** attempt) * (1 + random.random()))
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_registry = HttpClientRegistry()
+
+
+def get_http_clients() -> HttpClientRegistry:
+    return _registry
+
+
+def set_http_clients(registry: HttpClientRegistry) -> HttpClientRegistry:
+    """Replace the shared registry and return the previous one."""
+    global _registry
+    previous, _registry = _registry, registry
+    return previous
@@ -0,0 +1,227 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first when a model is at its concurrency limit
+INTERACTIVE = 0  # a user is waiting on this one call (outfit suggestions, outfit images)
+BULK = 1  # user-triggered fan-out (/api/wardrobe/ai-analyze)
+BACKGROUND = 2  # ingestion pipeline; queued but never shed or charged to a user
+
+DEFAULT_MODEL_CONCURRENCY = 4
+DEFAULT_MAX_QUEUE_DEPTH = 32
+DEFAULT_USER_REQUESTS_PER_MINUTE = 30
+DEFAULT_USER_BURST = 10
+DEFAULT_LATENCY_SECONDS = 5.0
+MAX_TRACKED_USERS = 4096
+
+
+class AdmissionRejected(Exception):
+    """Raised when a model call is turned away: the user is over quota or the model's queue is full."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def _parse_limits(value: str) -> dict[str, int]:
+    """"gemini-2.0-flash=8,imagen-3.0-generate-002=2" -> {"gemini-2.0-flash": 8, ...}"""
+    limits = {}
+    for entry in value.split(","):
+        model, _, limit = entry.partition("=")
+        if model.strip() and limit.strip():
+            limits[model.strip()] = int(limit)
+    return limits
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost: float = 1.0) -> float:
+        """Take `cost` tokens and return 0, or return the seconds until they would be available."""
+        self.refill()
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class ModelGate:
+    """Concurrency limit for one model, with waiters woken in priority order (FIFO within a priority)."""
+
+    def __init__(self, model: str, limit: int):
+        self.model = model
+        self.limit = max(1, limit)
+        self.active = 0
+        self.waiting = 0
+        self.latency = DEFAULT_LATENCY_SECONDS  # moving average of call duration, for Retry-After estimates
+        self.total_admitted = 0
+        self.total_shed = 0
+        self._heap: list[tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    def estimated_wait(self) -> float:
+        return (self.waiting / self.limit + 1) * self.latency
+
+    async def acquire(self, priority: int) -> None:
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._sequence), future))
+        self.waiting += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                # Still queued: its heap entry is skipped when popped
+                self.waiting -= 1
+            else:
+                # Granted a slot just as it was cancelled: hand it on
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._heap:
+            _, _, future = heapq.heappop(self._heap)
+            if future.done():
+                continue
+            # Pass the slot straight to the next waiter so `active` never dips below the limit
+            self.waiting -= 1
+            future.set_result(None)
+            return
+        self.active -= 1
+
+    def record_latency(self, seconds: float) -> None:
+        self.latency = 0.8 * self.latency + 0.2 * seconds
+
+    def snapshot(self) -> dict:
+        return {
+            "model": self.model,
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "latency": round(self.latency, 3),
+            "total_admitted": self.total_admitted,
+            "total_shed": self.total_shed,
+        }
+
+
+class LLMAdmissionController:
+    """Admission control in front of every Gemini/Imagen call.
+
+    Each model has a concurrency limit (LLM_MODEL_CONCURRENCY, e.g.
+    "gemini-2.0-flash=8,imagen-3.0-generate-002=2", else
+    LLM_DEFAULT_MODEL_CONCURRENCY); calls beyond it wait, INTERACTIVE ahead
+    of BULK ahead of BACKGROUND. Interactive calls are shed once
+    LLM_MAX_QUEUE_DEPTH calls are waiting for the model, bulk ones at half
+    that. Calls made for a user also take a token from that user's bucket
+    (LLM_USER_REQUESTS_PER_MINUTE, bursts up to LLM_USER_BURST).
+    Rejections raise AdmissionRejected with a Retry-After estimate.
+
+    Callers run on the event loop, so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        limits: dict[str, int] | None = None,
+        default_limit: int | None = None,
+        max_queue_depth: int | None = None,
+        user_requests_per_minute: float | None = None,
+        user_burst: float | None = None,
+    ):
+        self.limits = limits if limits is not None else _parse_limits(os.getenv("LLM_MODEL_CONCURRENCY", ""))
+        self.default_limit = default_limit or int(os.getenv("LLM_DEFAULT_MODEL_CONCURRENCY", DEFAULT_MODEL_CONCURRENCY))
+        self.max_queue_depth = max_queue_depth or int(os.getenv("LLM_MAX_QUEUE_DEPTH", DEFAULT_MAX_QUEUE_DEPTH))
+        self.user_rate = (user_requests_per_minute or float(os.getenv("LLM_USER_REQUESTS_PER_MINUTE", DEFAULT_USER_REQUESTS_PER_MINUTE))) / 60
+        self.user_burst = user_burst or float(os.getenv("LLM_USER_BURST", DEFAULT_USER_BURST))
+        self._gates: dict[str, ModelGate] = {}
+        self._buckets: dict[int, TokenBucket] = {}
+
+    def gate(self, model: str) -> ModelGate:
+        gate = self._gates.get(model)
+        if gate is None:
+            gate = self._gates[model] = ModelGate(model, self.limits.get(model, self.default_limit))
+        return gate
+
+    def _shed_depth(self, priority: int) -> int | None:
+        if priority <= INTERACTIVE:
+            return self.max_queue_depth
+        if priority == BULK:
+            return max(1, self.max_queue_depth // 2)
+        return None
+
+    def _charge(self, user_id: int) -> None:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_USERS:
+                # Drop buckets that have refilled; a fresh bucket for those users is equivalent
+                for idle_user, idle_bucket in list(self._buckets.items()):
+                    idle_bucket.refill()
+                    if idle_bucket.tokens >= idle_bucket.capacity:
+                        del self._buckets[idle_user]
+            bucket = self._buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+        wait = bucket.take()
+        if wait:
+            raise AdmissionRejected("Too many AI requests, please slow down", retry_after=wait)
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: int = INTERACTIVE, user_id: int | None = None):
+        """Hold one of the model's concurrency slots for the duration of a call."""
+        gate = self.gate(model)
+        shed_depth = self._shed_depth(priority)
+        if shed_depth is not None and gate.waiting >= shed_depth:
+            gate.total_shed += 1
+            logger.warning(f"Shedding {model} call: {gate.waiting} already waiting")
+            raise AdmissionRejected("AI service is busy, please try again shortly", retry_after=gate.estimated_wait())
+        if user_id is not None and priority != BACKGROUND:
+            self._charge(user_id)
+
+        await gate.acquire(priority)
+        gate.total_admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            gate.record_latency(time.monotonic() - started)
+            gate.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "max_queue_depth": self.max_queue_depth,
+            "models": [gate.snapshot() for gate in self._gates.values()],
+        }
+
+
+_controller = LLMAdmissionController()
+
+
+def get_llm_admission() -> LLMAdmissionController:
+    return _controller
+
+
+def set_llm_admission(controller: LLMAdmissionController) -> LLMAdmissionController:
+    """Replace the shared controller and return the previous one."""
+    global _controller
+    previous, _controller = _controller, controller
+    return previous
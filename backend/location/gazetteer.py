@@ -0,0 +1,81 @@
+"""Offline country / first-level region lookup backed by the bundled gazetteer.json.
+
+The data covers the countries the app supports and is loaded lazily on first
+use into a flat dict keyed by folded names, so a lookup is a couple of string
+operations plus one dict access.
+"""
+import json
+import os
+import re
+import unicodedata
+from functools import lru_cache
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.json")
+
+# Administrative words that vary between sources ("Sharjah Emirate", "Changwat Udon Thani", "Tai Po District").
+GENERIC_WORDS = {
+    "changwat", "district", "emirate", "federal", "governorate", "huyen", "mintaqat",
+    "of", "province", "region", "state", "territory", "the", "tinh",
+}
+
+
+def fold_name(value: str) -> str:
+    """Fold a place name to a comparison key: no accents, case, punctuation, generic words or spaces."""
+    value = value.replace("Đ", "D").replace("đ", "d")
+    value = "".join(ch for ch in unicodedata.normalize("NFKD", value) if not unicodedata.combining(ch))
+    words = re.sub(r"[^a-z0-9]+", " ", value.casefold()).split()
+    return "".join(word for word in words if word not in GENERIC_WORDS)
+
+
+@lru_cache(maxsize=1)
+def _load() -> tuple[
+    dict[str, str],
+    dict[tuple[str, str], tuple[float, float]],
+    dict[str, tuple[float, float]],
+    dict[tuple[str, str], str],
+]:
+    with open(GAZETTEER_PATH, encoding="utf-8") as handle:
+        data = json.load(handle)
+
+    country_codes: dict[str, str] = {}
+    regions: dict[tuple[str, str], tuple[float, float]] = {}
+    any_region: dict[str, tuple[float, float]] = {}
+    region_names: dict[tuple[str, str], str] = {}
+
+    for iso, country in data["countries"].items():
+        for alias in (iso, country["iso3"], country["name"], *country.get("aliases", [])):
+            country_codes[fold_name(alias)] = iso
+
+        if country.get("any_region"):
+            any_region[iso] = (country["latitude"], country["longitude"])
+
+        for name, latitude, longitude, aliases in country["regions"]:
+            for alias in (name, *aliases):
+                regions.setdefault((iso, fold_name(alias)), (latitude, longitude))
+                region_names.setdefault((iso, fold_name(alias)), name)
+
+    return country_codes, regions, any_region, region_names
+
+
+def country_code(country: str) -> str | None:
+    """ISO 3166-1 alpha-2 code for a country name, code or alias."""
+    return _load()[0].get(fold_name(country))
+
+
+def region_name(iso: str, state: str) -> str | None:
+    """Canonical gazetteer name for a region alias within a country."""
+    return _load()[3].get((iso, fold_name(state)))
+
+
+def lookup(country: str, state: str) -> tuple[float, float] | None:
+    """Return (latitude, longitude) for a country/state pair, or None when it isn't in the gazetteer."""
+    _, regions, any_region, _ = _load()
+    iso = country_code(country)
+    if iso is None:
+        return None
+
+    coordinates = regions.get((iso, fold_name(state)))
+    if coordinates is None:
+        # City-states are small enough that any district resolves to the city itself.
+        coordinates = any_region.get(iso)
+    return coordinates
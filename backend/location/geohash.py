@@ -0,0 +1,35 @@
+"""Minimal geohash encoder used to group nearby coordinates into shared cells."""
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode(latitude: float, longitude: float, precision: int = 5) -> str:
+    """Encode a coordinate as a geohash of `precision` characters.
+
+    Precision 4 is a ~39 km cell, 5 is ~4.9 km and 6 is ~1.2 km.
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        value, bounds = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits <<= 1
+            bounds[1] = mid
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
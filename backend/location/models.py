@@ -1,13 +1,20 @@
-from sqlalchemy import Column, Float, Integer, String
+from sqlalchemy import Column, DateTime, Float, Index, Integer, String
 
 from database import Base
 
 
 class Location(Base):
     __tablename__ = "locations"
+    __table_args__ = (
+        Index("uq_locations_country_state_key", "country_key", "state_key", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     country = Column(String, nullable=False)
     state = Column(String, nullable=False)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
+    # Case/whitespace-normalised lookup keys; nullable so older rows can be backfilled at startup.
+    country_key = Column(String, nullable=True)
+    state_key = Column(String, nullable=True)
+    geocoded_at = Column(DateTime, nullable=True)  # When latitude/longitude were last resolved from country/state; None for caller-supplied coordinates
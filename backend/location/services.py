@@ -1,12 +1,20 @@
+import logging
 import os
+from datetime import datetime, timedelta, timezone
 
-import httpx
-
+from database import engine, merge_rows
+from http_clients import get_http_clients
+from location import gazetteer
 from location.models import Location
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
+logger = logging.getLogger(__name__)
 
 GOOGLE_GEOCODING_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+# Admin-region centroids essentially never move, so geocoded coordinates are kept for a long time.
+DEFAULT_GEOCODE_TTL_DAYS = 90
 
 
 def _country_display_name(country: str) -> str:
@@ -41,9 +49,8 @@ async def _geocode_location(country: str, state: str) -> tuple[float, float]:
     if len(country_code) == 2:
         params["components"] = f"country:{country_code}"
 
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.get(GOOGLE_GEOCODING_URL, params=params)
-        data = response.json()
+    response = await get_http_clients().request("geocoding", "GET", GOOGLE_GEOCODING_URL, params=params)
+    data = response.json()
 
     if data.get("status") != "OK" or not data.get("results"):
         raise ValueError(f"Could not geolocate the provided country/state: {state}, {country_name}")
@@ -58,25 +65,125 @@ async def _geocode_location(country: str, state: str) -> tuple[float, float]:
     return latitude, longitude
 
 
+async def _resolve_coordinates(country: str, state: str) -> tuple[float, float]:
+    """Resolve from the bundled gazetteer when possible, otherwise fall back to the Geocoding API."""
+    coordinates = gazetteer.lookup(country, state)
+    if coordinates is not None:
+        return coordinates
+    return await _geocode_location(country, state)
+
+
+def _normalize_key(value: str) -> str:
+    return " ".join(value.split()).casefold()
+
+
+def location_keys(country: str, state: str) -> tuple[str, str]:
+    """Lookup keys for a (country, state) pair, so "AE"/"UAE" and "Sharjah"/"Ash Shariqah" resolve to one row.
+
+    Countries and regions the gazetteer knows are keyed by its ISO code and
+    region name, the same canonicalisation its coordinate lookup uses; anything
+    else falls back to the case/whitespace-normalised text.
+    """
+    iso = gazetteer.country_code(country)
+    if iso is None:
+        return _normalize_key(_country_display_name(country.strip())), _normalize_key(state)
+    return iso, _normalize_key(gazetteer.region_name(iso, state) or state)
+
+
+def _geocode_is_fresh(location: Location) -> bool:
+    if location.geocoded_at is None:
+        return False
+    geocoded_at = location.geocoded_at
+    if geocoded_at.tzinfo is None:
+        geocoded_at = geocoded_at.replace(tzinfo=timezone.utc)
+    ttl_days = int(os.getenv("LOCATION_GEOCODE_TTL_DAYS", DEFAULT_GEOCODE_TTL_DAYS))
+    return datetime.now(timezone.utc) - geocoded_at < timedelta(days=ttl_days)
+
+
+def backfill_location_keys() -> int:
+    """Bring every row's lookup keys up to date, merging rows whose keys coincide.
+
+    Covers rows created before lookup keys existed and rows keyed before the
+    current canonicalisation (e.g. a new gazetteer alias). Runs at startup, so
+    requests never see a stale key. Returns the number of rows merged away.
+    """
+    merged = 0
+    with engine.begin() as connection:
+        table = Location.__table__
+        rows = connection.execute(select(table.c.id, table.c.country, table.c.state, table.c.country_key, table.c.state_key)).all()
+        rows_by_key: dict[tuple[str, str], list] = {}
+        for row in rows:
+            rows_by_key.setdefault(location_keys(row.country, row.state), []).append(row)
+
+        rekeyed = []
+        for key, group in rows_by_key.items():
+            keep = max(group, key=lambda row: row.id)
+            dropped = [row.id for row in group if row.id != keep.id]
+            merge_rows(connection, table, keep.id, dropped)
+            merged += len(dropped)
+            if (keep.country_key, keep.state_key) != key:
+                rekeyed.append((keep.id, key))
+
+        # Clear first so a row taking over another row's old key can't trip the unique index
+        ids = [row_id for row_id, _ in rekeyed]
+        if ids:
+            connection.execute(update(table).where(table.c.id.in_(ids)).values(country_key=None, state_key=None))
+        for row_id, (country_key, state_key) in rekeyed:
+            connection.execute(update(table).where(table.c.id == row_id).values(country_key=country_key, state_key=state_key))
+    if merged:
+        logger.warning(f"Merged {merged} locations that normalise to the same country/state")
+    return merged
+
+
+def _find_location(db: Session, country_key: str, state_key: str) -> Location | None:
+    return db.query(Location).filter(
+        Location.country_key == country_key,
+        Location.state_key == state_key,
+    ).first()
+
+
 async def get_or_create_location(db: Session, country: str, state: str, latitude: float | None = None, longitude: float | None = None) -> Location:
-    if latitude is None or longitude is None:
-        latitude, longitude = await _geocode_location(country, state)
+    country_key, state_key = location_keys(country, state)
+    location = _find_location(db, country_key, state_key)
 
-    location = db.query(Location).filter(Location.country == country, Location.state == state).first()
     if location:
-        location.latitude = latitude
-        location.longitude = longitude
+        if latitude is None or longitude is None:
+            if _geocode_is_fresh(location):
+                return location
+            location.latitude, location.longitude = await _resolve_coordinates(country, state)
+            location.geocoded_at = datetime.now(timezone.utc)
+        elif (location.latitude, location.longitude) != (latitude, longitude):
+            # Caller-supplied coordinates were never geocoded
+            location.latitude = latitude
+            location.longitude = longitude
+            location.geocoded_at = None
+        else:
+            return location
+
         db.commit()
         db.refresh(location)
         return location
 
+    geocoded_at = None
+    if latitude is None or longitude is None:
+        latitude, longitude = await _resolve_coordinates(country, state)
+        geocoded_at = datetime.now(timezone.utc)
+
     new_location = Location(
         country=country,
         state=state,
+        country_key=country_key,
+        state_key=state_key,
         latitude=latitude,
         longitude=longitude,
+        geocoded_at=geocoded_at,
     )
     db.add(new_location)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request created the same location first.
+        db.rollback()
+        return _find_location(db, country_key, state_key)
     db.refresh(new_location)
     return new_location
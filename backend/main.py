@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -8,18 +10,25 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from database import engine, Base, get_db
+from database import engine, Base, ensure_columns, ensure_indexes, get_db
+from genai_clients import get_genai_clients
+from http_clients import get_http_clients
+from llm_admission import get_llm_admission
+from wardrobe.background_removal import get_background_removal_engine
+from wardrobe.ingestion import get_ingestion_pipeline
 from user.models import User
 from user.schemas import RegisterRequest, LoginRequest, TokenResponse, UserResponse
 from user.auth import hash_password, verify_password, create_access_token
 
 # Import wardrobe and outfit models so their tables get created
-from wardrobe.models import WardrobeItem  # noqa: F401
+from wardrobe.models import WardrobeItem, ImageBlob, IngestionJob, IngestionTask, AnalysisCacheEntry  # noqa: F401
 from generated_outfit.models import GeneratedOutfit  # noqa: F401
 from location.models import Location  # noqa: F401
+from location.services import backfill_location_keys
 from outfit_request.models import OutfitRequest  # noqa: F401
 from wardrobe_suggestion_history.models import WardrobeSuggestionHistory  # noqa: F401
 from weather_data.models import WeatherData  # noqa: F401
+from textile_shop.models import TextileShop  # noqa: F401
 from generated_outfit.routes import router as generated_outfit_router
 from location.routes import router as location_router
 from outfit_request.routes import router as outfit_request_router
@@ -27,18 +36,44 @@ from outfit_suggestion.routes import router as outfit_suggestion_router
 from textile_shop.routes import router as textile_shop_router
 from wardrobe.routes import router as wardrobe_router
 from wardrobe_suggestion_history.routes import router as wardrobe_suggestion_history_router
+from weather_data.prefetch import ForecastPrefetcher, prefetch_enabled
 from weather_data.routes import router as weather_data_router
 
 # --- Create all tables ---
 Base.metadata.create_all(bind=engine)
+ensure_columns()
+ensure_indexes()
+backfill_location_keys()
 
 # --- Uploads directory ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOADS_DIR = os.path.join(BASE_DIR, "uploads")
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
+# --- Background jobs ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_http_clients().open()
+    get_genai_clients().warm()
+    if os.getenv("REMBG_PRELOAD", "true").lower() in ("1", "true"):
+        await get_background_removal_engine().start()
+    await get_ingestion_pipeline().start()
+    forecast_prefetcher = ForecastPrefetcher() if prefetch_enabled() else None
+    if forecast_prefetcher:
+        forecast_prefetcher.start()
+    try:
+        yield
+    finally:
+        if forecast_prefetcher:
+            await forecast_prefetcher.stop()
+        await get_ingestion_pipeline().stop()
+        await get_http_clients().aclose()
+        await get_genai_clients().aclose()
+        await get_background_removal_engine().stop()
+
+
 # --- App ---
-app = FastAPI(title="Style-AI Backend", version="1.0.0")
+app = FastAPI(title="Style-AI Backend", version="1.0.0", lifespan=lifespan)
 
 # --- OpenAPI Security Scheme (for Swagger docs) ---
 # This tells Swagger to prompt for Authorization and send it as an HTTP header.
@@ -156,3 +191,9 @@ def login(req: LoginRequest, db: Session = Depends(get_db)):
 @app.get("/api/health")
 def health_check():
     return {"status": "ok"}
+
+
+@app.get("/api/ai/status")
+def ai_status():
+    """Concurrency, queue depth and shedding counts of the LLM admission controller, per model."""
+    return get_llm_admission().snapshot()
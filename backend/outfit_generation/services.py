@@ -1,7 +1,8 @@
-import asyncio
 import os
 import uuid
 
+from genai_clients import get_genai_clients
+from llm_admission import INTERACTIVE, AdmissionRejected, get_llm_admission
 from weather_data.models import WeatherData
 
 
@@ -12,18 +13,14 @@ async def generate_outfit_image(
     age: int | None = None,
     country: str = "",
     state: str = "",
+    user_id: int | None = None,
 ) -> tuple[str, str, str, str]:
     """
     Generates an outfit image using Google Vertex AI.
     Returns: (top_description, bottom_description, image_url, prompt_used)
     """
-    project_id = os.environ.get("GOOGLE_CLOUD_PROJECT")
-    location = os.environ.get("GOOGLE_CLOUD_LOCATION", "us-central1")
+    models = get_genai_clients().models
 
-    if not project_id:
-        raise ValueError("GOOGLE_CLOUD_PROJECT environment variable is missing for Vertex AI.")
-
-    from google import genai
     from google.genai import types
 
     gender_str = gender.replace("_", " ") if gender and gender != "prefer_not_to_say" else "person"
@@ -39,27 +36,22 @@ async def generate_outfit_image(
         f"Only the clothes are shown, neatly arranged from a top-down perspective."
     )
 
-    def _generate():
-        client = genai.Client(
-            vertexai=True,
-            project=project_id,
-            location=location,
-        )
-        return client.models.generate_images(
-            model="imagen-3.0-generate-002",
-            prompt=prompt,
-            config=types.GenerateImagesConfig(
-                number_of_images=1,
-                aspect_ratio="1:1",
-                output_mime_type="image/jpeg",
-            ),
-        )
-
     import logging
 
     logger = logging.getLogger(__name__)
     try:
-        result = await asyncio.to_thread(_generate)
+        async with get_llm_admission().slot("imagen-3.0-generate-002", INTERACTIVE, user_id):
+            result = await models.generate_images(
+                model="imagen-3.0-generate-002",
+                prompt=prompt,
+                config=types.GenerateImagesConfig(
+                    number_of_images=1,
+                    aspect_ratio="1:1",
+                    output_mime_type="image/jpeg",
+                ),
+            )
+    except AdmissionRejected:
+        raise
     except Exception as exc:
         logger.error(f"Vertex AI image generation failed: {exc}", exc_info=True)
         raise
@@ -5,6 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
 from database import get_db
+from llm_admission import AdmissionRejected
 from outfit_request.schemas import OutfitGenerateRequest, OutfitRequestResponse
 from outfit_request.services import create_outfit_request_with_generation, get_outfit_request_by_id, list_outfit_requests
 from user.auth import get_current_user_id
@@ -31,6 +32,8 @@ async def generate_outfit(
             latitude=req.latitude,
             longitude=req.longitude,
         )
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Outfit generation failed: {str(e)}")
 
@@ -1,3 +1,4 @@
+import logging
 from datetime import date
 
 from fastapi import HTTPException
@@ -8,8 +9,12 @@ from location.services import get_or_create_location
 from outfit_generation.services import generate_outfit_image
 from outfit_request.models import OutfitRequest
 from user.models import User
+from wardrobe.derivatives import build_derivatives
+from wardrobe.storage import upload_url
 from weather_data.services import get_or_fetch_weather
 
+logger = logging.getLogger(__name__)
+
 
 async def ensure_request_weather(db: Session, outfit_request: OutfitRequest) -> OutfitRequest:
     if outfit_request.weather is not None:
@@ -60,14 +65,23 @@ async def create_outfit_request_with_generation(db: Session, user_id: int, occas
         age,
         country,
         state,
+        user_id=user_id,
     )
 
+    derivatives = {}
+    try:
+        derivatives = await build_derivatives(image_url.removeprefix("/uploads/"))
+    except Exception as exc:
+        logger.warning(f"Outfit image derivatives failed for request {outfit_request.id}: {exc}")
+
     create_generated_outfit(
         db,
         request_id=outfit_request.id,
         top_description=top_description,
         bottom_description=bottom_description,
         image_url=image_url,
+        thumbnail_url=upload_url(derivatives.get("thumb")),
+        medium_url=upload_url(derivatives.get("medium")),
         llm_model_used="imagegeneration@006",
         prompt_used=prompt_used,
     )
@@ -4,6 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
 from database import get_db
+from llm_admission import AdmissionRejected
 from location.services import get_or_create_location
 from outfit_request.schemas import OutfitGenerateRequest
 from outfit_suggestion.schemas import WardrobeItemBrief, WardrobeSuggestionResponse
@@ -76,17 +77,13 @@ async def suggest_from_wardrobe_route(
             age=age,
             country=req.country,
             state=req.state,
+            user_id=user_id,
         )
 
         selected_items = []
         for item in items:
             if item.id in selected_ids:
-                selected_items.append(WardrobeItemBrief(
-                    id=item.id,
-                    category=item.category,
-                    image_url=f"/uploads/{item.filename}",
-                    bg_removed_image_url=f"/uploads/{item.bg_removed_filename}" if item.bg_removed_filename else None,
-                ))
+                selected_items.append(WardrobeItemBrief.from_item(item))
 
         weather_schema = WeatherDataSchema.model_validate(weather)
 
@@ -113,5 +110,7 @@ async def suggest_from_wardrobe_route(
         )
     except HTTPException:
         raise
+    except AdmissionRejected as exc:
+        raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": exc.retry_after_header})
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Suggestion failed: {str(exc)}")
@@ -2,6 +2,7 @@ from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
+from wardrobe.storage import upload_url
 from weather_data.schemas import WeatherDataSchema
 
 
@@ -10,10 +11,24 @@ class WardrobeItemBrief(BaseModel):
     category: str
     image_url: str
     bg_removed_image_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    bg_removed_thumbnail_url: Optional[str] = None
 
     class Config:
         from_attributes = True
 
+    @classmethod
+    def from_item(cls, item):
+        derivatives = item.derivatives or {}
+        return cls(
+            id=item.id,
+            category=item.category,
+            image_url=upload_url(item.filename),
+            bg_removed_image_url=upload_url(item.bg_removed_filename),
+            thumbnail_url=upload_url(derivatives.get("thumb")),
+            bg_removed_thumbnail_url=upload_url(derivatives.get("cutout_thumb")),
+        )
+
 
 class WardrobeSuggestionResponse(BaseModel):
     occasion: str
@@ -1,5 +1,5 @@
-import asyncio
-import os
+from genai_clients import get_genai_clients
+from llm_admission import INTERACTIVE, AdmissionRejected, get_llm_admission
 
 
 async def suggest_outfit_from_wardrobe(
@@ -10,6 +10,7 @@ async def suggest_outfit_from_wardrobe(
     age: int | None = None,
     country: str = "",
     state: str = "",
+    user_id: int | None = None,
 ) -> tuple[str, list[int], str]:
     """
     Use Gemini to suggest an outfit from the user's wardrobe.
@@ -20,13 +21,8 @@ async def suggest_outfit_from_wardrobe(
 
     logger = logging.getLogger(__name__)
 
-    project_id = os.environ.get("GOOGLE_CLOUD_PROJECT")
-    location = os.environ.get("GOOGLE_CLOUD_LOCATION", "us-central1")
+    models = get_genai_clients().models
 
-    if not project_id:
-        raise ValueError("GOOGLE_CLOUD_PROJECT environment variable is missing.")
-
-    from google import genai
     from google.genai import types
 
     gender_str = gender.replace("_", " ") if gender and gender != "prefer_not_to_say" else "person"
@@ -87,23 +83,16 @@ async def suggest_outfit_from_wardrobe(
         f"Only use item IDs from the list above. The selected_item_ids array must NEVER be empty. Be specific about why each piece works."
     )
 
-    def _ask_gemini():
-        client = genai.Client(
-            vertexai=True,
-            project=project_id,
-            location=location,
-        )
-        return client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.7,
-                max_output_tokens=1024,
-            ),
-        )
-
     try:
-        result = await asyncio.to_thread(_ask_gemini)
+        async with get_llm_admission().slot("gemini-2.0-flash", INTERACTIVE, user_id):
+            result = await models.generate_content(
+                model="gemini-2.0-flash",
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    temperature=0.7,
+                    max_output_tokens=1024,
+                ),
+            )
         text = result.text.strip()
 
         if "```json" in text:
@@ -122,6 +111,8 @@ async def suggest_outfit_from_wardrobe(
     except json.JSONDecodeError:
         logger.warning("Could not parse Gemini response as JSON, returning raw text")
         return result.text.strip(), [], prompt
+    except AdmissionRejected:
+        raise
     except Exception as exc:
         logger.error(f"Gemini suggestion failed: {exc}", exc_info=True)
         raise
@@ -0,0 +1,24 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Float, Index, Integer, String
+
+from database import Base
+
+
+class TextileShop(Base):
+    """Shops seen in Places results, kept so nearby searches can be answered locally."""
+
+    __tablename__ = "textile_shops"
+    __table_args__ = (
+        Index("ix_textile_shops_lat_lng", "latitude", "longitude"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    dedupe_key = Column(String, nullable=False, unique=True)
+    name = Column(String, nullable=False)
+    address = Column(String, nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    rating = Column(Float, nullable=True)
+    user_rating_count = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
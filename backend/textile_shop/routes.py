@@ -1,7 +1,23 @@
+import json
+
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
 
-from textile_shop.schemas import TextileShopSearchRequest, TextileShopSearchResponse
-from textile_shop.services import search_nearby_textile_shops
+from database import get_db
+from textile_shop.schemas import (
+    TextileShopCacheStats,
+    TextileShopSearchRequest,
+    TextileShopSearchResponse,
+    TextileShopStreamRequest,
+)
+from textile_shop.services import (
+    normalize_location_query,
+    search_nearby_textile_shops,
+    search_textile_shops_near_point,
+    shop_search_cache,
+    stream_textile_shop_pages,
+)
 from user.auth import get_current_user_id
 
 
@@ -12,13 +28,59 @@ router = APIRouter(prefix="/api/textile-shops", tags=["Textile Shops"])
 async def nearby_textile_shops(
     req: TextileShopSearchRequest,
     user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
 ):
     try:
-        shops = await search_nearby_textile_shops(
-            location_query=req.location_query,
-        )
+        if req.latitude is not None and req.longitude is not None:
+            shops = await search_textile_shops_near_point(
+                db,
+                latitude=req.latitude,
+                longitude=req.longitude,
+                radius_km=req.radius_km,
+                limit=req.limit,
+                location_query=req.location_query,
+            )
+        else:
+            shops = await search_nearby_textile_shops(
+                location_query=req.location_query,
+                db=db,
+            )
         return TextileShopSearchResponse(shops=shops)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
     except Exception as exc:
-        raise HTTPException(status_code=500, detail=f"Textile shop search failed: {str(exc)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Textile shop search failed: {str(exc)}")
+
+
+@router.post("/nearby/stream")
+async def stream_nearby_textile_shops(
+    req: TextileShopStreamRequest,
+    user_id: int = Depends(get_current_user_id),
+):
+    """Stream shops as NDJSON, one line per Places page, so the UI can render the first page immediately.
+
+    Each line is {"page": n, "shops": [...]}; the last line is {"done": true, "total": n}
+    or {"done": true, "error": "..."} if a page failed.
+    """
+    if not normalize_location_query(req.location_query):
+        raise HTTPException(status_code=400, detail="A location is required to search for textile shops.")
+
+    async def _ndjson():
+        total = 0
+        page = 0
+        try:
+            async for shops in stream_textile_shop_pages(req.location_query, req.limit):
+                page += 1
+                total += len(shops)
+                yield json.dumps({"page": page, "shops": [shop.model_dump() for shop in shops]}) + "\n"
+        except Exception as exc:
+            yield json.dumps({"done": True, "total": total, "error": str(exc)}) + "\n"
+            return
+        yield json.dumps({"done": True, "total": total}) + "\n"
+
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+
+@router.get("/cache-stats", response_model=TextileShopCacheStats)
+def textile_shop_cache_stats(user_id: int = Depends(get_current_user_id)):
+    return shop_search_cache.stats()
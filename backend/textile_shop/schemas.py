@@ -1,8 +1,26 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 
 class TextileShopSearchRequest(BaseModel):
+    location_query: str | None = Field(default=None, min_length=2, max_length=120)
+    latitude: float | None = Field(default=None, ge=-90, le=90)
+    longitude: float | None = Field(default=None, ge=-180, le=180)
+    radius_km: float = Field(default=10.0, gt=0, le=50)
+    limit: int = Field(default=6, ge=1, le=50)
+
+    @model_validator(mode="after")
+    def require_query_or_coordinates(self):
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValueError("latitude and longitude must be provided together")
+        if self.location_query is None and self.latitude is None:
+            raise ValueError("Provide a location_query or latitude/longitude")
+        return self
+
+
+class TextileShopStreamRequest(BaseModel):
     location_query: str = Field(min_length=2, max_length=120)
+    # Places returns at most 60 results (3 pages of 20) for a query.
+    limit: int = Field(default=20, ge=1, le=60)
 
 
 class TextileShopSummary(BaseModel):
@@ -12,7 +30,18 @@ class TextileShopSummary(BaseModel):
     longitude: float | None = None
     rating: float | None = None
     user_rating_count: int | None = None
+    distance_km: float | None = None
 
 
 class TextileShopSearchResponse(BaseModel):
     shops: list[TextileShopSummary]
+
+
+class TextileShopCacheStats(BaseModel):
+    entries: int
+    max_entries: int
+    ttl: float
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
@@ -1,39 +1,203 @@
+import asyncio
+import logging
+import math
 import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator
 
-import httpx
+import numpy as np
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
 
+from database import SessionLocal
+from http_clients import get_http_clients
+from location import gazetteer
+from textile_shop.models import TextileShop
 from textile_shop.schemas import TextileShopSummary
+from ttl_cache import TTLCache
 
+logger = logging.getLogger(__name__)
 
 GOOGLE_PLACES_URL = "https://places.googleapis.com/v1/places:searchText"
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_RADIUS_KM = 10.0
+MAX_RADIUS_KM = 50.0
+DEFAULT_RESULT_LIMIT = 6
+DEFAULT_MIN_LOCAL_RESULTS = 3
+PLACES_MAX_PAGE_SIZE = 20
 
+# Shop listings change over days, not seconds.
+shop_search_cache = TTLCache(
+    max_entries=int(os.getenv("TEXTILE_SHOP_CACHE_MAX_ENTRIES", 512)),
+    ttl=float(os.getenv("TEXTILE_SHOP_CACHE_TTL_SECONDS", 24 * 60 * 60)),
+)
 
-async def search_nearby_textile_shops(
-    location_query: str,
-) -> list[TextileShopSummary]:
+
+def normalize_location_query(location_query: str) -> str:
+    """Cache key for a free-text location: case-folded, whitespace-collapsed, with a known
+    country alias replaced by its code and a known region alias by its gazetteer name.
+
+    Only the part just before the country is treated as a region, and only when a city
+    comes before it, so a city that shares a region's alias keeps its own name:
+
+    >>> normalize_location_query("Kochi, kerala , India")
+    'kochi, kerala, IN'
+    >>> normalize_location_query("Hanoi, Vietnam")
+    'hanoi, VN'
+    >>> normalize_location_query("Jakarta, DKI Jakarta, Indonesia")
+    'jakarta, jakarta raya, ID'
+    >>> normalize_location_query(",,")
+    ''
+    """
+    parts = [" ".join(part.split()).casefold() for part in re.split(r"[,;]", location_query)]
+    parts = [part for part in parts if part]
+
+    iso = gazetteer.country_code(parts[-1]) if len(parts) > 1 else None
+    if iso is not None:
+        parts[-1] = iso
+        if len(parts) > 2:
+            parts[-2] = (gazetteer.region_name(iso, parts[-2]) or parts[-2]).casefold()
+    return ", ".join(parts)
+
+
+def _shop_dedupe_key(name: str, address: str) -> str:
+    return f"{name.strip().lower()}|{address.strip().lower()}"
+
+
+def haversine_km(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km from one point to arrays of points."""
+    lat1 = np.radians(latitude)
+    lat2 = np.radians(latitudes)
+    dlat = lat2 - lat1
+    dlng = np.radians(longitudes - longitude)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _bounding_box(latitude: float, longitude: float, radius_km: float) -> tuple[float, float, float | None, float | None]:
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat = max(-90.0, latitude - lat_delta)
+    max_lat = min(90.0, latitude + lat_delta)
+
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat < 1e-6:
+        return min_lat, max_lat, None, None
+    lng_delta = math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+    min_lng, max_lng = longitude - lng_delta, longitude + lng_delta
+    # Boxes that wrap the antimeridian just skip the longitude filter.
+    if min_lng < -180.0 or max_lng > 180.0:
+        return min_lat, max_lat, None, None
+    return min_lat, max_lat, min_lng, max_lng
+
+
+def shop_max_age() -> timedelta:
+    """How long a stored shop is trusted without Places listing it again; defaults to the search cache TTL."""
+    return timedelta(seconds=float(os.getenv("TEXTILE_SHOP_MAX_AGE_SECONDS", shop_search_cache.ttl)))
+
+
+def find_nearby_shops(db: Session, latitude: float, longitude: float, radius_km: float, limit: int) -> list[TextileShopSummary]:
+    """The `limit` nearest stored shops within `radius_km`, closest first.
+
+    Shops Places hasn't listed within `shop_max_age()` are left out, since they
+    may have closed or moved; the caller's Places fallback refreshes the ones
+    that are still there.
+    """
+    min_lat, max_lat, min_lng, max_lng = _bounding_box(latitude, longitude, radius_km)
+    query = db.query(TextileShop).filter(
+        TextileShop.latitude.between(min_lat, max_lat),
+        TextileShop.updated_at >= datetime.now(timezone.utc) - shop_max_age(),
+    )
+    if min_lng is not None:
+        query = query.filter(TextileShop.longitude.between(min_lng, max_lng))
+    candidates = query.all()
+    if not candidates:
+        return []
+
+    distances = haversine_km(
+        latitude,
+        longitude,
+        np.fromiter((shop.latitude for shop in candidates), dtype=float, count=len(candidates)),
+        np.fromiter((shop.longitude for shop in candidates), dtype=float, count=len(candidates)),
+    )
+    within = np.flatnonzero(distances <= radius_km)
+    nearest = within[np.argsort(distances[within], kind="stable")][:limit]
+
+    return [
+        TextileShopSummary(
+            name=candidates[index].name,
+            address=candidates[index].address,
+            latitude=candidates[index].latitude,
+            longitude=candidates[index].longitude,
+            rating=candidates[index].rating,
+            user_rating_count=candidates[index].user_rating_count,
+            distance_km=round(float(distances[index]), 3),
+        )
+        for index in nearest
+    ]
+
+
+def store_shops(db: Session, shops: list[TextileShopSummary]) -> None:
+    """Upsert shops that have coordinates into the local index."""
+    now = datetime.now(timezone.utc)
+    rows = {
+        _shop_dedupe_key(shop.name, shop.address): {
+            "dedupe_key": _shop_dedupe_key(shop.name, shop.address),
+            "name": shop.name,
+            "address": shop.address,
+            "latitude": shop.latitude,
+            "longitude": shop.longitude,
+            "rating": shop.rating,
+            "user_rating_count": shop.user_rating_count,
+            "updated_at": now,
+        }
+        for shop in shops
+        if shop.latitude is not None and shop.longitude is not None
+    }
+    if not rows:
+        return
+
+    statement = sqlite_insert(TextileShop).values(list(rows.values()))
+    statement = statement.on_conflict_do_update(
+        index_elements=[TextileShop.dedupe_key],
+        set_={
+            column: statement.excluded[column]
+            for column in ("name", "address", "latitude", "longitude", "rating", "user_rating_count", "updated_at")
+        },
+    )
+    db.execute(statement)
+    db.commit()
+
+
+async def _fetch_places_page(
+    text_query: str,
+    page_size: int,
+    page_token: str | None = None,
+    location_bias: dict | None = None,
+) -> tuple[list[dict], str | None]:
+    """Fetch one page of Places searchText results. Returns (places, next_page_token)."""
     api_key = os.getenv("GOOGLE_MAPS_API_KEY")
     if not api_key:
         raise ValueError("GOOGLE_MAPS_API_KEY environment variable is missing.")
 
-    normalized_location = location_query.strip()
-    if not normalized_location:
-        raise ValueError("A location is required to search for textile shops.")
-
     payload = {
-        "textQuery": f"textile shop near {normalized_location}",
-        "maxResultCount": 6,
+        "textQuery": text_query,
+        "pageSize": min(page_size, PLACES_MAX_PAGE_SIZE),
     }
+    if page_token:
+        payload["pageToken"] = page_token
+    if location_bias:
+        payload["locationBias"] = location_bias
     headers = {
         "Content-Type": "application/json",
         "X-Goog-Api-Key": api_key,
         "X-Goog-FieldMask": (
             "places.displayName,places.formattedAddress,places.location,"
-            "places.rating,places.userRatingCount"
+            "places.rating,places.userRatingCount,nextPageToken"
         ),
     }
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        response = await client.post(GOOGLE_PLACES_URL, json=payload, headers=headers)
+    response = await get_http_clients().request("places", "POST", GOOGLE_PLACES_URL, json=payload, headers=headers)
 
     if response.status_code >= 400:
         try:
@@ -43,10 +207,12 @@ async def search_nearby_textile_shops(
         raise ValueError(f"Google Places request failed: {error_body}")
 
     data = response.json()
-    places = data.get("places", [])
+    return data.get("places", []), data.get("nextPageToken")
 
+
+def _parse_places(places: list[dict], seen: set) -> list[TextileShopSummary]:
+    """Convert Places results to summaries, skipping anything already in `seen` (updated in place)."""
     shops: list[TextileShopSummary] = []
-    seen = set()
     for place in places:
         name = (place.get("displayName") or {}).get("text")
         address = place.get("formattedAddress")
@@ -69,5 +235,96 @@ async def search_nearby_textile_shops(
                 user_rating_count=place.get("userRatingCount"),
             )
         )
+    return shops
+
+
+async def _search_places(text_query: str, location_bias: dict | None = None, max_results: int = 6) -> list[TextileShopSummary]:
+    places, _ = await _fetch_places_page(text_query, max_results, location_bias=location_bias)
+    return _parse_places(places, set())
+
+
+async def stream_textile_shop_pages(location_query: str, limit: int) -> AsyncIterator[list[TextileShopSummary]]:
+    """Yield deduplicated shops page by page until `limit` shops have been produced.
+
+    Places only hands out the next page token with the current page, so pages
+    can't be requested in parallel. Instead the next page is requested as soon
+    as its token arrives, and runs while the current page is parsed, stored and
+    sent to the client.
+    """
+    normalized_location = location_query.strip()
+    if not normalize_location_query(normalized_location):
+        raise ValueError("A location is required to search for textile shops.")
+
+    text_query = f"textile shop near {normalized_location}"
+    seen: set = set()
+    remaining = limit
+    pending = asyncio.create_task(_fetch_places_page(text_query, remaining))
+    try:
+        while pending is not None:
+            places, next_page_token = await pending
+            pending = None
+
+            shops = _parse_places(places, seen)[:remaining]
+            remaining -= len(shops)
+            if next_page_token and remaining > 0:
+                pending = asyncio.create_task(_fetch_places_page(text_query, remaining, page_token=next_page_token))
+
+            if shops:
+                db = SessionLocal()
+                try:
+                    store_shops(db, shops)
+                finally:
+                    db.close()
+                yield shops
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+async def search_textile_shops_near_point(
+    db: Session,
+    latitude: float,
+    longitude: float,
+    radius_km: float = DEFAULT_RADIUS_KM,
+    limit: int = DEFAULT_RESULT_LIMIT,
+    location_query: str | None = None,
+) -> list[TextileShopSummary]:
+    """Answer from the local index, asking Places only when it has too few fresh shops in range."""
+    shops = find_nearby_shops(db, latitude, longitude, radius_km, limit)
+    min_local = min(limit, int(os.getenv("TEXTILE_SHOP_MIN_LOCAL_RESULTS", DEFAULT_MIN_LOCAL_RESULTS)))
+    if len(shops) >= min_local:
+        return shops
+
+    text_query = f"textile shop near {location_query.strip()}" if location_query and location_query.strip() else "textile shop"
+    location_bias = {
+        "circle": {
+            "center": {"latitude": latitude, "longitude": longitude},
+            "radius": min(radius_km, MAX_RADIUS_KM) * 1000,
+        }
+    }
+    store_shops(db, await _search_places(text_query, location_bias, max_results=max(limit, DEFAULT_RESULT_LIMIT)))
+    return find_nearby_shops(db, latitude, longitude, radius_km, limit)
+
+
+async def search_nearby_textile_shops(
+    location_query: str,
+    db: Session | None = None,
+) -> list[TextileShopSummary]:
+    normalized_location = location_query.strip()
+    cache_key = normalize_location_query(normalized_location)
+    if not cache_key:
+        # Punctuation-only input like ",," would otherwise share one cache entry and send Places an empty query
+        raise ValueError("A location is required to search for textile shops.")
+
+    cached = shop_search_cache.get(cache_key)
+    if cached is not None:
+        logger.debug(f"Textile shop cache hit for '{cache_key}'")
+        return list(cached)
+    logger.debug(f"Textile shop cache miss for '{cache_key}'")
+
+    shops = await _search_places(f"textile shop near {normalized_location}")
+    if db is not None:
+        store_shops(db, shops)
 
+    shop_search_cache.set(cache_key, tuple(shops))
     return shops
@@ -0,0 +1,181 @@
+"""Background-removal engine backed by a pool of rembg worker processes.
+
+Each worker loads one rembg/onnxruntime session when it starts and reuses it
+for every image. Requests are queued and handed to workers in batches, so a
+10-item upload costs one round trip per batch instead of one per image, and
+the model is never loaded on the request path.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "u2net"
+DEFAULT_WORKERS = 2
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_BATCH_WAIT_MS = 20
+
+# Set in each worker process by _init_worker.
+_session = None
+
+
+def _init_worker(model_name: str, intra_op_threads: int) -> None:
+    global _session
+    # rembg sizes its onnxruntime thread pools from OMP_NUM_THREADS.
+    os.environ["OMP_NUM_THREADS"] = str(intra_op_threads)
+    import rembg
+
+    _session = rembg.new_session(model_name)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _remove_batch(jobs: list[tuple[str, str]]) -> list[str | None]:
+    """Run in a worker: remove backgrounds for (source, destination) paths. Returns an error per job or None."""
+    import rembg
+
+    errors: list[str | None] = []
+    for source_path, destination_path in jobs:
+        try:
+            with open(source_path, "rb") as source:
+                output_data = rembg.remove(source.read(), session=_session)
+            os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+            with open(destination_path, "wb") as destination:
+                destination.write(output_data)
+            errors.append(None)
+        except Exception as exc:
+            errors.append(f"{type(exc).__name__}: {exc}")
+    return errors
+
+
+class BackgroundRemovalEngine:
+    def __init__(
+        self,
+        model_name: str | None = None,
+        workers: int | None = None,
+        intra_op_threads: int | None = None,
+        batch_size: int | None = None,
+        batch_wait_ms: int | None = None,
+    ):
+        self.model_name = model_name or os.getenv("REMBG_MODEL", DEFAULT_MODEL)
+        self.workers = max(1, workers or int(os.getenv("REMBG_WORKERS", DEFAULT_WORKERS)))
+        default_threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self.intra_op_threads = max(1, intra_op_threads or int(os.getenv("REMBG_INTRA_OP_THREADS", default_threads)))
+        self.batch_size = max(1, batch_size or int(os.getenv("REMBG_BATCH_SIZE", DEFAULT_BATCH_SIZE)))
+        self.batch_wait = (batch_wait_ms if batch_wait_ms is not None else int(os.getenv("REMBG_BATCH_WAIT_MS", DEFAULT_BATCH_WAIT_MS))) / 1000
+
+        self._pool: ProcessPoolExecutor | None = None
+        self._queue: asyncio.Queue | None = None
+        self._dispatcher: asyncio.Task | None = None
+        self._in_flight: asyncio.Semaphore | None = None
+        self._batches: set[asyncio.Task] = set()
+
+    async def start(self, warm: bool = True) -> None:
+        if self._pool is not None:
+            return
+        self._pool = self._new_pool()
+        self._queue = asyncio.Queue()
+        self._in_flight = asyncio.Semaphore(self.workers)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+        if warm:
+            # One task per worker makes the pool spawn them all and load the model now, not on the first upload.
+            loop = asyncio.get_running_loop()
+            pids = await asyncio.gather(*(loop.run_in_executor(self._pool, _ping) for _ in range(self.workers)))
+            logger.info(f"Background removal engine ready: model={self.model_name} workers={len(set(pids))}")
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_name, self.intra_op_threads),
+        )
+
+    def _replace_broken_pool(self, broken: ProcessPoolExecutor) -> None:
+        # Concurrent batches all see the same broken pool; only the first one replaces it.
+        if self._pool is not broken:
+            return
+        logger.warning("Background removal worker died, restarting the worker pool")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._pool = self._new_pool()
+
+    async def stop(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def remove_background(self, source_path: str, destination_path: str) -> None:
+        """Write a background-removed PNG of `source_path` to `destination_path`."""
+        if self._pool is None:
+            await self.start(warm=False)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((source_path, destination_path, future))
+        await future
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._in_flight.acquire()
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: list[tuple[str, str, asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        jobs = [(source, destination) for source, destination, _ in batch]
+        try:
+            pool = self._pool
+            try:
+                errors = await loop.run_in_executor(pool, _remove_batch, jobs)
+            except BrokenProcessPool:
+                # A worker was killed (e.g. out of memory in onnxruntime) and the pool refuses all further work:
+                # replace it and give this batch one more try.
+                self._replace_broken_pool(pool)
+                errors = await loop.run_in_executor(self._pool, _remove_batch, jobs)
+        except Exception as exc:
+            errors = [f"{type(exc).__name__}: {exc}"] * len(batch)
+        finally:
+            self._in_flight.release()
+
+        for (_, _, future), error in zip(batch, errors):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(RuntimeError(f"Background removal failed: {error}"))
+
+
+_engine: BackgroundRemovalEngine | None = None
+
+
+def get_background_removal_engine() -> BackgroundRemovalEngine:
+    global _engine
+    if _engine is None:
+        _engine = BackgroundRemovalEngine()
+    return _engine
@@ -0,0 +1,169 @@
+"""Local colour extraction for wardrobe images.
+
+Pixels are clustered with a small vectorised k-means in CIELAB space, where
+Euclidean distance roughly tracks perceived colour difference, and each
+cluster is named after the closest entry of NAMED_COLORS. For background-
+removed cutouts only pixels inside the alpha mask count; for plain photos
+the central region is used to keep most of the background out.
+"""
+import numpy as np
+from PIL import Image, ImageOps
+
+SAMPLE_EDGE = 96
+CLUSTERS = 5
+ITERATIONS = 12
+MIN_SECONDARY_SHARE = 0.12
+
+NAMED_COLORS = {
+    "black": (20, 20, 20),
+    "charcoal": (54, 69, 79),
+    "grey": (128, 128, 128),
+    "light grey": (200, 200, 200),
+    "white": (245, 245, 245),
+    "cream": (255, 253, 208),
+    "beige": (222, 203, 164),
+    "tan": (210, 180, 140),
+    "khaki": (189, 183, 107),
+    "brown": (120, 72, 40),
+    "olive": (107, 112, 40),
+    "green": (40, 140, 60),
+    "dark green": (20, 70, 40),
+    "mint": (170, 230, 200),
+    "teal": (0, 128, 128),
+    "turquoise": (64, 200, 200),
+    "light blue": (150, 190, 230),
+    "blue": (40, 90, 200),
+    "navy": (25, 35, 80),
+    "denim": (80, 110, 150),
+    "purple": (110, 50, 150),
+    "lavender": (190, 170, 220),
+    "maroon": (110, 20, 30),
+    "burgundy": (128, 0, 50),
+    "red": (200, 30, 40),
+    "coral": (250, 128, 114),
+    "pink": (235, 130, 170),
+    "light pink": (250, 200, 210),
+    "orange": (240, 130, 30),
+    "mustard": (210, 170, 40),
+    "yellow": (245, 220, 60),
+}
+
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """Convert an (..., 3) array of sRGB values in 0-255 to CIELAB (D65)."""
+    srgb = rgb.astype(np.float64) / 255.0
+    linear = np.where(srgb <= 0.04045, srgb / 12.92, ((srgb + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ np.array([
+        [0.4124, 0.3576, 0.1805],
+        [0.2126, 0.7152, 0.0722],
+        [0.0193, 0.1192, 0.9505],
+    ]).T
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16 / 116)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+_PALETTE_NAMES = list(NAMED_COLORS)
+_PALETTE_LAB = rgb_to_lab(np.array(list(NAMED_COLORS.values())))
+
+
+def _garment_pixels(path: str) -> np.ndarray:
+    with Image.open(path) as source:
+        source.draft("RGB", (SAMPLE_EDGE * 2, SAMPLE_EDGE * 2))
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        image = image.convert("RGBA")
+        # Nearest-neighbour sampling keeps real garment colours instead of inventing blends at edges and stripes
+        image.thumbnail((SAMPLE_EDGE, SAMPLE_EDGE), Image.NEAREST)
+
+    pixels = np.asarray(image)
+    if has_alpha:
+        mask = pixels[..., 3] > 128
+    else:
+        height, width = pixels.shape[:2]
+        mask = np.zeros((height, width), dtype=bool)
+        mask[height // 5: height - height // 5, width // 5: width - width // 5] = True
+    return pixels[mask][:, :3]
+
+
+def _kmeans(points: np.ndarray, clusters: int) -> tuple[np.ndarray, np.ndarray]:
+    """Return (centres, labels). Deterministic k-means++ seeding so the same image always gives the same colours."""
+    rng = np.random.default_rng(0)
+    centres = [points[rng.integers(len(points))]]
+    for _ in range(1, clusters):
+        distances = np.min(((points[:, None, :] - np.array(centres)[None, :, :]) ** 2).sum(axis=2), axis=1)
+        if distances.sum() == 0:
+            break
+        centres.append(points[rng.choice(len(points), p=distances / distances.sum())])
+    centres = np.array(centres)
+
+    for _ in range(ITERATIONS):
+        labels = ((points[:, None, :] - centres[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        updated = np.array([
+            points[labels == index].mean(axis=0) if np.any(labels == index) else centres[index]
+            for index in range(len(centres))
+        ])
+        if np.allclose(updated, centres):
+            break
+        centres = updated
+    return centres, labels
+
+
+def extract_colors(path: str) -> list[dict]:
+    """Dominant colours of the garment, largest first: [{"name", "hex", "lab", "share"}, ...].
+
+    Clusters that map to the same palette name are merged.
+    """
+    rgb = _garment_pixels(path)
+    if len(rgb) == 0:
+        return []
+
+    lab = rgb_to_lab(rgb)
+    centres, labels = _kmeans(lab, min(CLUSTERS, len(lab)))
+    counts = np.bincount(labels, minlength=len(centres))
+    names = ((centres[:, None, :] - _PALETTE_LAB[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+
+    merged: dict[str, dict] = {}
+    for index, count in enumerate(counts):
+        if count == 0:
+            continue
+        name = _PALETTE_NAMES[names[index]]
+        entry = merged.setdefault(name, {"count": 0, "rgb_sum": np.zeros(3), "lab_sum": np.zeros(3)})
+        entry["count"] += int(count)
+        entry["rgb_sum"] += rgb[labels == index].sum(axis=0)
+        entry["lab_sum"] += centres[index] * count
+
+    total = len(rgb)
+    palette = []
+    for name, entry in sorted(merged.items(), key=lambda pair: -pair[1]["count"]):
+        mean_rgb = (entry["rgb_sum"] / entry["count"]).round().astype(int)
+        palette.append({
+            "name": name,
+            "hex": "#{:02x}{:02x}{:02x}".format(*mean_rgb),
+            "lab": [round(float(value), 1) for value in entry["lab_sum"] / entry["count"]],
+            "share": round(entry["count"] / total, 3),
+        })
+    return palette
+
+
+def color_attributes(palette: list[dict]) -> dict:
+    """primaryColor / secondaryColors in the same form the Gemini analysis uses."""
+    if not palette:
+        return {}
+    secondary = [entry["name"] for entry in palette[1:] if entry["share"] >= MIN_SECONDARY_SHARE]
+    return {
+        "primaryColor": palette[0]["name"],
+        "secondaryColors": ", ".join(secondary) if secondary else "none",
+    }
+
+
+def with_local_colors(analysis: dict | None, palette: list[dict] | None) -> dict | None:
+    """Fill colour attributes the analysis is missing (or has left blank) from the local palette."""
+    local = color_attributes(palette or [])
+    if not local:
+        return analysis
+    merged = dict(analysis or {})
+    for key, value in local.items():
+        if not merged.get(key):
+            merged[key] = value
+    return merged
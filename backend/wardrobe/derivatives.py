@@ -0,0 +1,91 @@
+"""Downsized copies of uploaded and generated images for list and grid views.
+
+Each source image gets one file per entry in DERIVATIVE_SIZES under
+`uploads/derived/`, in WebP by default. Background-removed cutouts are first
+cropped to the bounding box of their alpha channel so the garment fills the
+frame instead of floating in the original canvas.
+"""
+import asyncio
+import logging
+import os
+
+from PIL import Image, ImageOps
+
+from wardrobe.storage import upload_path
+
+logger = logging.getLogger(__name__)
+
+DERIVED_DIR = "derived"
+DERIVATIVE_SIZES = {"thumb": 256, "medium": 768}
+FORMATS = {
+    "webp": ("WEBP", ".webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", ".jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def _output_format() -> tuple[str, str, dict]:
+    return FORMATS.get(os.getenv("WARDROBE_DERIVATIVE_FORMAT", "webp").lower(), FORMATS["webp"])
+
+
+def write_derivatives(source_filename: str, prefix: str = "", crop_alpha: bool = False) -> dict[str, str]:
+    """Write every derivative size of an uploads-relative image; returns {prefix + size name: uploads-relative filename}."""
+    image_format, ext, save_options = _output_format()
+    stem = os.path.splitext(os.path.basename(source_filename))[0]
+    os.makedirs(upload_path(DERIVED_DIR), exist_ok=True)
+
+    with Image.open(upload_path(source_filename)) as source:
+        # Let the JPEG decoder downscale by a power of two while decoding when the source is much larger.
+        largest = max(DERIVATIVE_SIZES.values())
+        source.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(source)
+
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        if has_alpha:
+            image = image.convert("RGBA")
+            if crop_alpha:
+                bbox = image.getchannel("A").getbbox()
+                if bbox:
+                    image = image.crop(bbox)
+            if image_format == "JPEG":
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+        else:
+            image = image.convert("RGB")
+
+        derivatives = {}
+        for name, edge in DERIVATIVE_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail((edge, edge), Image.LANCZOS)
+            filename = f"{DERIVED_DIR}/{stem}_{name}{ext}"
+            resized.save(upload_path(filename), image_format, **save_options)
+            derivatives[f"{prefix}{name}"] = filename
+    return derivatives
+
+
+async def build_derivatives(source_filename: str, prefix: str = "", crop_alpha: bool = False) -> dict[str, str]:
+    return await asyncio.to_thread(write_derivatives, source_filename, prefix, crop_alpha)
+
+
+async def build_item_derivatives(item, blob=None) -> dict[str, str]:
+    """(Re)build derivatives for a WardrobeItem's original and, if present, its background-removed cutout.
+
+    With the item's ImageBlob, derivatives the blob already has are reused
+    and newly built ones are recorded on it for the next duplicate.
+    """
+    prefixes = ("", "cutout_") if item.bg_removed_filename else ("",)
+    wanted = [f"{prefix}{name}" for prefix in prefixes for name in DERIVATIVE_SIZES]
+    if blob is not None and blob.derivatives and all(
+        key in blob.derivatives and os.path.exists(upload_path(blob.derivatives[key])) for key in wanted
+    ):
+        item.derivatives = dict(blob.derivatives)
+        return item.derivatives
+
+    derivatives = await build_derivatives(item.filename)
+    if item.bg_removed_filename:
+        derivatives.update(await build_derivatives(item.bg_removed_filename, prefix="cutout_", crop_alpha=True))
+    item.derivatives = derivatives
+    if blob is not None:
+        blob.derivatives = dict(derivatives)
+    return derivatives
+
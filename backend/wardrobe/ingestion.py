@@ -0,0 +1,357 @@
+"""Background ingestion pipeline for uploaded wardrobe items.
+
+An upload creates an IngestionJob with one IngestionTask per (item, stage):
+persist -> background removal -> derivatives -> colours -> analysis.
+Workers take items off a queue and run their stages in order, skipping any
+already completed, so retrying a failed job only redoes the failed stage and
+the ones after it. If background removal fails the later stages still run, on
+the original image. Every state change is published to in-process subscribers
+for the job's progress stream.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from llm_admission import BACKGROUND
+from wardrobe.background_removal import get_background_removal_engine
+from wardrobe.colors import extract_colors, with_local_colors
+from wardrobe.derivatives import build_item_derivatives
+from wardrobe.models import IngestionJob, IngestionTask, WardrobeItem
+from wardrobe.storage import blob_for_item, upload_path
+
+logger = logging.getLogger(__name__)
+
+PERSIST = "persist"
+REMOVE_BACKGROUND = "remove_background"
+DERIVATIVES = "derivatives"
+COLORS = "colors"
+ANALYZE = "analyze"
+STAGES = (PERSIST, REMOVE_BACKGROUND, DERIVATIVES, COLORS, ANALYZE)
+
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+DEFAULT_INGEST_WORKERS = 4
+
+
+# The later stages still run on the original image when one of these fails
+OPTIONAL_STAGES = {REMOVE_BACKGROUND}
+# Stages built from the cutout when there is one, so they are redone once a failed background removal succeeds
+CUTOUT_STAGES = (DERIVATIVES, COLORS)
+
+
+def _remaining(statuses: dict[str, str]) -> list[str]:
+    """Statuses of the stages that will still run: stages after a failed required one stay pending but never run."""
+    remaining = []
+    for stage in STAGES:
+        status = statuses.get(stage)
+        if status == FAILED and stage not in OPTIONAL_STAGES:
+            break
+        if status in (PENDING, RUNNING):
+            remaining.append(status)
+    return remaining
+
+
+def job_status(task_statuses: list[tuple[int, str, str]]) -> str:
+    """Overall status from (item_id, stage, status) triples."""
+    by_item: dict[int, dict[str, str]] = {}
+    for item_id, stage, status in task_statuses:
+        by_item.setdefault(item_id, {})[stage] = status
+
+    remaining = [status for statuses in by_item.values() for status in _remaining(statuses)]
+    if remaining:
+        return RUNNING if RUNNING in remaining else PENDING
+    if any(FAILED in statuses.values() for statuses in by_item.values()):
+        return FAILED
+    return COMPLETED
+
+
+def create_job(db: Session, user_id: int, items: list[WardrobeItem]) -> IngestionJob:
+    """Create a job for already-saved items. Stages whose output the item already has start out completed."""
+    job = IngestionJob(user_id=user_id)
+    db.add(job)
+    db.flush()
+
+    for item in items:
+        done = {
+            PERSIST: True,
+            REMOVE_BACKGROUND: bool(item.bg_removed_filename),
+            DERIVATIVES: bool(item.derivatives) and (not item.bg_removed_filename or "cutout_thumb" in item.derivatives),
+            COLORS: bool(item.colors),
+            # Local colours alone don't count as an analysis
+            ANALYZE: bool(item.image_analysis and item.image_analysis.get("type")),
+        }
+        for stage in STAGES:
+            db.add(IngestionTask(job_id=job.id, item_id=item.id, stage=stage, status=COMPLETED if done[stage] else PENDING))
+
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def job_snapshot(db: Session, job: IngestionJob) -> dict:
+    tasks = db.query(IngestionTask).filter(IngestionTask.job_id == job.id).order_by(IngestionTask.item_id).all()
+    items: dict[int, dict] = {}
+    for task in tasks:
+        items.setdefault(task.item_id, {"item_id": task.item_id, "stages": {}})["stages"][task.stage] = {
+            "status": task.status,
+            "attempts": task.attempts,
+            "error": task.error,
+        }
+    return {
+        "id": job.id,
+        "status": job_status([(task.item_id, task.stage, task.status) for task in tasks]),
+        "created_at": job.created_at,
+        "items": list(items.values()),
+    }
+
+
+async def remove_item_background(db: Session, item: WardrobeItem) -> None:
+    """Give the item a background-removed cutout, reusing the one its blob already has."""
+    if item.bg_removed_filename and os.path.exists(upload_path(item.bg_removed_filename)):
+        return
+
+    blob = blob_for_item(db, item)
+    if blob is not None and blob.bg_removed_filename and os.path.exists(upload_path(blob.bg_removed_filename)):
+        item.bg_removed_filename = blob.bg_removed_filename
+        return
+
+    if blob is not None:
+        unique_name = f"removed_bg/{blob.content_hash}_cutout.png"
+    else:
+        unique_name = f"removed_bg/processed_{uuid.uuid4().hex}.png"
+    await get_background_removal_engine().remove_background(upload_path(item.filename), upload_path(unique_name))
+    item.bg_removed_filename = unique_name
+    if blob is not None:
+        blob.bg_removed_filename = unique_name
+
+
+async def _derivatives(db: Session, item: WardrobeItem) -> None:
+    await build_item_derivatives(item, blob_for_item(db, item))
+
+
+async def _colors(db: Session, item: WardrobeItem) -> None:
+    # Cheap and local, so the item shows its colours long before the model analysis comes back
+    image_path = upload_path(item.bg_removed_filename or item.filename)
+    item.colors = await asyncio.to_thread(extract_colors, image_path)
+    item.image_analysis = with_local_colors(item.image_analysis, item.colors)
+
+
+async def _analyze(db: Session, item: WardrobeItem) -> None:
+    from wardrobe.services import analyze_clothing_image
+
+    # Prefer bg-removed image for cleaner analysis, fall back to original
+    image_path = upload_path(item.bg_removed_filename or item.filename)
+    item.image_analysis = with_local_colors(await analyze_clothing_image(image_path, BACKGROUND), item.colors)
+
+
+async def _persist(db: Session, item: WardrobeItem) -> None:
+    if not os.path.exists(upload_path(item.filename)):
+        raise FileNotFoundError(f"Upload missing for item {item.id}")
+
+
+STAGE_HANDLERS = {
+    PERSIST: _persist,
+    REMOVE_BACKGROUND: remove_item_background,
+    DERIVATIVES: _derivatives,
+    COLORS: _colors,
+    ANALYZE: _analyze,
+}
+
+
+class IngestionEvents:
+    """In-process fan-out of job progress events to stream subscribers.
+
+    Events only reach subscribers in the worker process that ran the stage;
+    clients on another worker still see progress through the status endpoint.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+
+    def subscribe(self, job_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_id: int, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[job_id]
+
+    def publish(self, job_id: int, event: dict) -> None:
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait(event)
+
+
+class IngestionPipeline:
+    """Worker tasks that run ingestion stages for queued (job, item) pairs."""
+
+    def __init__(self, workers: int | None = None):
+        self.workers = max(1, workers or int(os.getenv("WARDROBE_INGEST_WORKERS", DEFAULT_INGEST_WORKERS)))
+        self.events = IngestionEvents()
+        self._queue: asyncio.Queue | None = None
+        self._queued: set[tuple[int, int]] = set()
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._resume()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._queue = None
+        self._queued.clear()
+
+    def _resume(self) -> None:
+        """Re-queue work left unfinished by a previous process; stages that were mid-run start over."""
+        db = SessionLocal()
+        try:
+            unfinished = db.query(IngestionTask).filter(IngestionTask.status.in_([PENDING, RUNNING])).all()
+            pairs = sorted({(task.job_id, task.item_id) for task in unfinished})
+            for task in unfinished:
+                task.status = PENDING
+            db.commit()
+        finally:
+            db.close()
+
+        for job_id, item_id in pairs:
+            self.enqueue(job_id, item_id)
+        if pairs:
+            logger.info(f"Resumed {len(pairs)} unfinished wardrobe ingestion items")
+
+    def enqueue(self, job_id: int, item_id: int) -> None:
+        if self._queue is None:
+            # Not started (e.g. called outside the app lifespan): pick it up on the next start.
+            return
+        if (job_id, item_id) in self._queued:
+            return
+        self._queued.add((job_id, item_id))
+        self._queue.put_nowait((job_id, item_id))
+
+    def enqueue_job(self, db: Session, job: IngestionJob) -> None:
+        item_ids = {
+            item_id
+            for (item_id,) in db.query(IngestionTask.item_id).filter(
+                IngestionTask.job_id == job.id, IngestionTask.status == PENDING
+            ).distinct()
+        }
+        for item_id in sorted(item_ids):
+            self.enqueue(job.id, item_id)
+
+    def retry(self, db: Session, job: IngestionJob) -> int:
+        """Reset the job's failed stages to pending and queue their items.
+
+        Completed stages are kept, except those that fell back to the original
+        image because background removal failed: they are redone from the cutout.
+        """
+        failed = db.query(IngestionTask).filter(IngestionTask.job_id == job.id, IngestionTask.status == FAILED).all()
+        redo = list(failed)
+        for task in failed:
+            if task.stage == REMOVE_BACKGROUND:
+                redo += db.query(IngestionTask).filter(
+                    IngestionTask.job_id == job.id,
+                    IngestionTask.item_id == task.item_id,
+                    IngestionTask.stage.in_(CUTOUT_STAGES),
+                    IngestionTask.status == COMPLETED,
+                ).all()
+        for task in redo:
+            task.status = PENDING
+            task.error = None
+            task.updated_at = datetime.now(timezone.utc)
+        db.commit()
+        self.enqueue_job(db, job)
+        return len(failed)
+
+    async def _work(self) -> None:
+        while True:
+            job_id, item_id = await self._queue.get()
+            self._queued.discard((job_id, item_id))
+            try:
+                await self.process_item(job_id, item_id)
+            except Exception as exc:
+                logger.error(f"Wardrobe ingestion crashed for job {job_id} item {item_id}: {exc}", exc_info=True)
+
+    def _set_status(self, db: Session, task: IngestionTask, status: str, error: str | None = None) -> None:
+        task.status = status
+        task.error = error
+        task.updated_at = datetime.now(timezone.utc)
+        if status == RUNNING:
+            task.attempts += 1
+        db.commit()
+
+        statuses = db.query(IngestionTask.item_id, IngestionTask.stage, IngestionTask.status).filter(IngestionTask.job_id == task.job_id).all()
+        self.events.publish(task.job_id, {
+            "job_id": task.job_id,
+            "item_id": task.item_id,
+            "stage": task.stage,
+            "status": task.status,
+            "attempts": task.attempts,
+            "error": task.error,
+            "job_status": job_status(statuses),
+        })
+
+    async def process_item(self, job_id: int, item_id: int) -> None:
+        """Run the item's remaining stages in order, stopping at the first failure of a required stage."""
+        db = SessionLocal()
+        try:
+            item = db.query(WardrobeItem).filter(WardrobeItem.id == item_id).first()
+            tasks = {
+                task.stage: task
+                for task in db.query(IngestionTask).filter(IngestionTask.job_id == job_id, IngestionTask.item_id == item_id)
+            }
+            for stage in STAGES:
+                task = tasks.get(stage)
+                if task is None or task.status == COMPLETED:
+                    continue
+                if task.status == FAILED:
+                    if stage in OPTIONAL_STAGES:
+                        continue
+                    break
+                if item is None:
+                    self._set_status(db, task, FAILED, "Item was deleted")
+                    break
+
+                self._set_status(db, task, RUNNING)
+                try:
+                    await STAGE_HANDLERS[stage](db, item)
+                except Exception as exc:
+                    logger.warning(f"Wardrobe ingestion stage {stage} failed for item {item_id}: {exc}")
+                    db.rollback()
+                    self._set_status(db, task, FAILED, f"{type(exc).__name__}: {exc}")
+                    if stage in OPTIONAL_STAGES:
+                        continue
+                    break
+                self._set_status(db, task, COMPLETED)
+        finally:
+            db.close()
+
+
+_pipeline: IngestionPipeline | None = None
+
+
+def get_ingestion_pipeline() -> IngestionPipeline:
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = IngestionPipeline()
+    return _pipeline
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON, UniqueConstraint
 from datetime import datetime, timezone
 from database import Base
 
@@ -11,5 +11,69 @@ class WardrobeItem(Base):
     category = Column(String, nullable=False, index=True)
     filename = Column(String, nullable=False)
     bg_removed_filename = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True, index=True)  # SHA-256 of the uploaded bytes
+    perceptual_hash = Column(String, nullable=True)  # 64-bit dHash as hex, see wardrobe/near_duplicates.py
+    near_duplicate_of_id = Column(Integer, ForeignKey("wardrobe_items.id", ondelete="SET NULL"), nullable=True)
+    derivatives = Column(JSON, nullable=True)  # Resized copies, e.g. {"thumb": "derived/x_thumb.webp", "cutout_thumb": ...}
+    colors = Column(JSON, nullable=True)  # Dominant colours from wardrobe/colors.py: [{"name", "hex", "lab", "share"}, ...]
     image_analysis = Column(JSON, nullable=True)  # Stores: type, subtype, primaryColor, secondaryColors, fit, length, fabricType, texture
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class ImageBlob(Base):
+    """One stored copy of an uploaded image, shared by every item with the same bytes."""
+
+    __tablename__ = "wardrobe_image_blobs"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    content_hash = Column(String, nullable=False, unique=True)  # SHA-256 hex
+    filename = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    content_type = Column(String, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    bg_removed_filename = Column(String, nullable=True)
+    derivatives = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class IngestionJob(Base):
+    """A batch of uploaded items being taken through the ingestion stages in the background."""
+
+    __tablename__ = "wardrobe_ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class IngestionTask(Base):
+    """State of one stage for one item of an ingestion job."""
+
+    __tablename__ = "wardrobe_ingestion_tasks"
+    __table_args__ = (
+        UniqueConstraint("job_id", "item_id", "stage", name="uq_wardrobe_ingestion_tasks_job_item_stage"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    job_id = Column(Integer, ForeignKey("wardrobe_ingestion_jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    item_id = Column(Integer, ForeignKey("wardrobe_items.id", ondelete="CASCADE"), nullable=False, index=True)
+    stage = Column(String, nullable=False)  # persist, remove_background, derivatives, colors, analyze
+    status = Column(String, nullable=False, default="pending")  # pending, running, completed, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class AnalysisCacheEntry(Base):
+    """Gemini attribute analysis of an exact image, for one prompt/model version."""
+
+    __tablename__ = "wardrobe_analysis_cache"
+    __table_args__ = (
+        UniqueConstraint("image_hash", "analysis_version", name="uq_wardrobe_analysis_cache_hash_version"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    image_hash = Column(String, nullable=False)  # SHA-256 of the analysed image bytes
+    analysis_version = Column(String, nullable=False)
+    analysis = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,161 @@
+"""Perceptual hashing and a per-user near-duplicate index for wardrobe images.
+
+Each image gets a 64-bit difference hash (dHash): the image is shrunk to a
+9x8 greyscale grid and each bit records whether a pixel is brighter than its
+right-hand neighbour. Re-encoded, resized or lightly edited copies of a
+photo land within a few bits of each other. Hashes are kept in a BK-tree per
+user, so a lookup only visits the branches that can be within the distance
+threshold instead of comparing against every item.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+from PIL import Image, ImageOps
+from sqlalchemy.orm import Session
+
+from wardrobe.models import WardrobeItem
+from wardrobe.storage import upload_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NEAR_DUPLICATE_DISTANCE = 6
+HASH_SIZE = 8
+
+
+def near_duplicate_distance() -> int:
+    return int(os.getenv("WARDROBE_NEAR_DUPLICATE_DISTANCE", DEFAULT_NEAR_DUPLICATE_DISTANCE))
+
+
+def image_dhash(path: str) -> str:
+    """64-bit dHash of an image file as 16 hex characters."""
+    with Image.open(path) as image:
+        image.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+        image = ImageOps.exif_transpose(image).convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return np.packbits(bits.ravel()).tobytes().hex()
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes with Hamming distance."""
+
+    def __init__(self):
+        self._root: tuple[int, list, dict] | None = None
+        self.size = 0
+
+    def add(self, value: int, key) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = (value, [key], {})
+            return
+        node = self._root
+        while True:
+            node_value, keys, children = node
+            distance = hamming(value, node_value)
+            if distance == 0:
+                keys.append(key)
+                return
+            child = children.get(distance)
+            if child is None:
+                children[distance] = (value, [key], {})
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> list[tuple[int, object]]:
+        """(distance, key) pairs within `max_distance` of `value`, nearest first."""
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node_value, keys, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                matches.extend((distance, key) for key in keys)
+            # Triangle inequality: only children whose edge is within the radius of `distance` can match.
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return sorted(matches, key=lambda match: match[0])
+
+
+class NearDuplicateIndex:
+    """Lazily built BK-tree per user, mapping perceptual hashes to item ids.
+
+    Trees are built from the database on first use and kept up to date on
+    upload; BK-trees can't remove entries, so a delete just drops the user's
+    tree to be rebuilt on the next lookup.
+    """
+
+    def __init__(self):
+        self._trees: dict[int, BKTree] = {}
+        self._lock = threading.Lock()
+
+    def _build(self, db: Session, user_id: int) -> BKTree:
+        # Items uploaded before hashing existed get their hash filled in here; it is saved with the caller's commit.
+        tree = BKTree()
+        for item in db.query(WardrobeItem).filter(WardrobeItem.user_id == user_id):
+            if item.perceptual_hash is None:
+                path = upload_path(item.filename)
+                if not os.path.exists(path):
+                    continue
+                try:
+                    item.perceptual_hash = image_dhash(path)
+                except Exception as exc:
+                    logger.warning(f"Could not hash wardrobe item {item.id}: {exc}")
+                    continue
+            tree.add(int(item.perceptual_hash, 16), item.id)
+        return tree
+
+    def _tree(self, db: Session, user_id: int) -> BKTree:
+        with self._lock:
+            tree = self._trees.get(user_id)
+        if tree is None:
+            # Built outside the lock: a cold build reads and hashes images, and must not hold up other users' lookups
+            built = self._build(db, user_id)
+            with self._lock:
+                tree = self._trees.setdefault(user_id, built)
+        return tree
+
+    def find(
+        self,
+        db: Session,
+        user_id: int,
+        perceptual_hash: str,
+        max_distance: int | None = None,
+        exclude_item_id: int | None = None,
+    ) -> list[tuple[int, int]]:
+        """(distance, item_id) of the user's items within `max_distance` bits, nearest first.
+
+        The first lookup for a user builds their tree from the database (and
+        hashes any legacy images), so call it from a worker thread in async code.
+        """
+        if max_distance is None:
+            max_distance = near_duplicate_distance()
+        tree = self._tree(db, user_id)
+        with self._lock:
+            matches = tree.search(int(perceptual_hash, 16), max_distance)
+        return [(distance, item_id) for distance, item_id in matches if item_id != exclude_item_id]
+
+    def add(self, user_id: int, item_id: int, perceptual_hash: str) -> None:
+        with self._lock:
+            tree = self._trees.get(user_id)
+            if tree is not None:
+                tree.add(int(perceptual_hash, 16), item_id)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._trees.pop(user_id, None)
+
+
+_index = NearDuplicateIndex()
+
+
+def get_near_duplicate_index() -> NearDuplicateIndex:
+    return _index
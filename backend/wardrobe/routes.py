@@ -1,55 +1,251 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
+import asyncio
+import json
+import logging
 import os
-import uuid
-import shutil
 import io
+import shutil
+from dataclasses import dataclass
 from PIL import Image
-import rembg
 
-from database import get_db
+from database import SessionLocal, get_db
+from llm_admission import AdmissionRejected
 from user.auth import get_current_user_id
-from wardrobe.models import WardrobeItem
-from wardrobe.schemas import WardrobeItemResponse, BatchProcessRequest, ImageAnalysisData
+from wardrobe.colors import with_local_colors
+from wardrobe.derivatives import build_item_derivatives
+from wardrobe.ingestion import COMPLETED, FAILED, create_job, get_ingestion_pipeline, job_snapshot, remove_item_background
+from wardrobe.models import ImageBlob, IngestionJob, WardrobeItem
+from wardrobe.near_duplicates import get_near_duplicate_index, hamming, image_dhash, near_duplicate_distance
+from wardrobe.schemas import (
+    WardrobeItemResponse,
+    AnalyzeItemResult,
+    BackgroundRemovalItemResult,
+    BatchAnalyzeResponse,
+    BatchBackgroundRemovalResponse,
+    BatchProcessRequest,
+    BulkUploadResponse,
+    BulkUploadResult,
+    ImageAnalysisData,
+    IngestionJobResponse,
+    NearDuplicateMatch,
+)
+from wardrobe.storage import (
+    UPLOADS_DIR,
+    StoredUpload,
+    UploadRejected,
+    acquire_blob,
+    blob_for_item,
+    max_upload_bytes,
+    new_item,
+    release_item_files,
+    remove_files,
+    save_upload,
+    upload_path,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/wardrobe", tags=["Wardrobe"])
 
-# --- Uploads directory ---
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-UPLOADS_DIR = os.path.join(BASE_DIR, "uploads")
-os.makedirs(UPLOADS_DIR, exist_ok=True)
-
 VALID_CATEGORIES = ["Tops", "Bottoms", "Dresses", "Footwear", "Accessories"]
+DEFAULT_BULK_MAX_FILES = 50
+DEFAULT_ANALYZE_CONCURRENCY = 4
+DEFAULT_ANALYZE_TIMEOUT_SECONDS = 60
+
+
+@dataclass
+class _PreparedUpload:
+    stored: StoredUpload
+    perceptual_hash: str
+    original: WardrobeItem | None  # the user's closest look-alike, if any
+    cutout: str | None = None  # copy of the look-alike's cutout, made up front when reusing it
+
+
+async def _prepare_upload(db: Session, user_id: int, stored: StoredUpload, reuse_near_duplicate: bool = False) -> _PreparedUpload:
+    """Hash a stored upload and look for a near-duplicate. Reads only, so it holds no database write lock while it awaits."""
+    try:
+        # A deduplicated upload's own copy can't be unlinked by a concurrent delete
+        perceptual_hash = await asyncio.to_thread(image_dhash, upload_path(stored.spare_filename or stored.filename))
+    except (OSError, Image.DecompressionBombError):
+        # The header looked like an image but PIL can't decode it; drop this upload's copy, not a shared file
+        await asyncio.to_thread(remove_files, [stored.spare_filename if stored.deduplicated else stored.filename])
+        raise UploadRejected("Image could not be decoded. Upload a valid JPEG, PNG or WebP image", status_code=415)
+    matches = await asyncio.to_thread(get_near_duplicate_index().find, db, user_id, perceptual_hash)
+    prepared = _PreparedUpload(stored, perceptual_hash, None)
+    if not matches:
+        return prepared
+
+    # Building the index may have filled in legacy items' hashes; leave those for the insert's flush
+    with db.no_autoflush:
+        prepared.original = original = db.query(WardrobeItem).filter(WardrobeItem.id == matches[0][1]).first()
+        blob = db.query(ImageBlob).filter(ImageBlob.content_hash == stored.content_hash).first()
+    has_cutout = blob is not None and blob.bg_removed_filename and os.path.exists(upload_path(blob.bg_removed_filename))
+    if reuse_near_duplicate and original is not None and original.bg_removed_filename and not has_cutout:
+        if os.path.exists(upload_path(original.bg_removed_filename)):
+            # Copy rather than share the file: the two items live in different blobs.
+            prepared.cutout = f"removed_bg/{stored.content_hash}_cutout.png"
+            await asyncio.to_thread(shutil.copyfile, upload_path(original.bg_removed_filename), upload_path(prepared.cutout))
+    return prepared
+
+
+def _closest_item(perceptual_hash: str, items: List[WardrobeItem]) -> WardrobeItem | None:
+    """The nearest of `items` within the near-duplicate distance, for files of one request that the index hasn't seen yet."""
+    value = int(perceptual_hash, 16)
+    distance, item = min(
+        ((hamming(value, int(item.perceptual_hash, 16)), item) for item in items),
+        key=lambda pair: pair[0],
+        default=(None, None),
+    )
+    return item if distance is not None and distance <= near_duplicate_distance() else None
+
+
+def _add_uploaded_item(
+    db: Session,
+    user_id: int,
+    category: str,
+    prepared: _PreparedUpload,
+    reuse_near_duplicate: bool,
+) -> WardrobeItem:
+    """Create (and flush) the item for a prepared upload, flagging it if it looks like one the user already has.
+
+    This opens the write transaction, so it never awaits; commit straight after so other writers aren't kept waiting.
+    """
+    # Identical bytes share one blob and whatever has already been derived from it
+    blob = acquire_blob(db, prepared.stored)
+    item = new_item(user_id, category, prepared.stored, blob)
+    item.perceptual_hash = prepared.perceptual_hash
+
+    original = prepared.original
+    if original is not None:
+        item.near_duplicate_of_id = original.id
+        if reuse_near_duplicate:
+            if not item.image_analysis and original.image_analysis:
+                item.image_analysis = dict(original.image_analysis)
+            if not item.colors and original.colors:
+                item.colors = list(original.colors)
+    if prepared.cutout:
+        if not item.bg_removed_filename:
+            item.bg_removed_filename = blob.bg_removed_filename = prepared.cutout
+        elif item.bg_removed_filename != prepared.cutout:
+            # The blob got its own cutout while the copy was being made
+            remove_files([prepared.cutout])
+
+    db.add(item)
+    db.flush()
+    get_near_duplicate_index().add(user_id, item.id, prepared.perceptual_hash)
+    return item
 
 
 @router.post("", response_model=WardrobeItemResponse)
-def upload_wardrobe_item(
+async def upload_wardrobe_item(
+    request: Request,
     category: str = Form(...),
     file: UploadFile = File(...),
+    reuse_near_duplicate: bool = Form(False),
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
 ):
-    """Upload a clothing image to the wardrobe."""
+    """Upload a clothing image to the wardrobe.
+
+    Background removal and AI analysis run afterwards as an ingestion job;
+    follow it with `/jobs/{job_id}` or `/jobs/{job_id}/events`. If the image
+    looks like an item already in the wardrobe, `near_duplicate_of` names it;
+    with `reuse_near_duplicate` the new item also takes that item's cutout and
+    analysis instead of computing its own.
+    """
     if category not in VALID_CATEGORIES:
         raise HTTPException(status_code=400, detail=f"Invalid category. Must be one of: {VALID_CATEGORIES}")
 
-    # Generate unique filename
-    ext = os.path.splitext(file.filename)[1] or ".jpg"
-    unique_name = f"{uuid.uuid4().hex}{ext}"
-    filepath = os.path.join(UPLOADS_DIR, unique_name)
-
-    # Save file to disk
-    with open(filepath, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # Save to DB
-    item = WardrobeItem(user_id=user_id, category=category, filename=unique_name)
-    db.add(item)
+    # Refuse obviously oversized bodies before touching the file
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_upload_bytes() + 64 * 1024:
+        raise HTTPException(status_code=413, detail=f"File is larger than {max_upload_bytes()} bytes")
+
+    try:
+        stored = await save_upload(file)
+        prepared = await _prepare_upload(db, user_id, stored, reuse_near_duplicate)
+        # Save to DB
+        item = _add_uploaded_item(db, user_id, category, prepared, reuse_near_duplicate)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     db.commit()
     db.refresh(item)
 
-    return WardrobeItemResponse(id=item.id, category=item.category, image_url=f"/uploads/{item.filename}", image_analysis=item.image_analysis)
+    job = create_job(db, user_id, [item])
+    get_ingestion_pipeline().enqueue_job(db, job)
+
+    return WardrobeItemResponse.from_item(item, job_id=job.id)
+
+
+@router.post("/bulk", response_model=BulkUploadResponse)
+async def bulk_upload_wardrobe_items(
+    files: List[UploadFile] = File(...),
+    categories: List[str] = Form(...),
+    reuse_near_duplicate: bool = Form(False),
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """Upload many clothing images in one request.
+
+    Send one `categories` value per file (same order), or a single value for
+    all of them. Each file is validated and stored on its own, so a bad file
+    is reported in `results` without failing the rest. All new items are
+    saved in one transaction and share one ingestion job.
+    """
+    max_files = int(os.getenv("WARDROBE_BULK_MAX_FILES", DEFAULT_BULK_MAX_FILES))
+    if len(files) > max_files:
+        raise HTTPException(status_code=413, detail=f"Too many files. At most {max_files} per request")
+    if len(categories) == 1:
+        categories = categories * len(files)
+    if len(categories) != len(files):
+        raise HTTPException(status_code=400, detail="Provide one category per file, or a single category for all files")
+
+    results: List[BulkUploadResult] = []
+    accepted: List[tuple[BulkUploadResult, str, _PreparedUpload]] = []
+    for index, (file, category) in enumerate(zip(files, categories)):
+        result = BulkUploadResult(index=index, filename=file.filename, status="error")
+        results.append(result)
+
+        if category not in VALID_CATEGORIES:
+            result.error = f"Invalid category. Must be one of: {VALID_CATEGORIES}"
+            continue
+        try:
+            stored = await save_upload(file)
+            accepted.append((result, category, await _prepare_upload(db, user_id, stored, reuse_near_duplicate)))
+        except UploadRejected as e:
+            result.error = str(e)
+
+    # Every file is stored and hashed before the first write, so the write lock is only held for the inserts
+    created: List[tuple[BulkUploadResult, WardrobeItem]] = []
+    for result, category, prepared in accepted:
+        if prepared.original is None:
+            prepared.original = _closest_item(prepared.perceptual_hash, [item for _, item in created])
+        created.append((result, _add_uploaded_item(db, user_id, category, prepared, reuse_near_duplicate)))
+
+    job = None
+    if created:
+        try:
+            db.commit()
+        except Exception:
+            get_near_duplicate_index().invalidate(user_id)
+            raise
+        job = create_job(db, user_id, [item for _, item in created])
+        get_ingestion_pipeline().enqueue_job(db, job)
+
+    for result, item in created:
+        result.status = "created"
+        result.item = WardrobeItemResponse.from_item(item, job_id=job.id)
+
+    return BulkUploadResponse(
+        job_id=job.id if job else None,
+        created=len(created),
+        failed=len(results) - len(created),
+        results=results,
+    )
 
 
 @router.get("", response_model=List[WardrobeItemResponse])
@@ -59,16 +255,7 @@ def get_wardrobe_items(
 ):
     """Get all wardrobe items for the current user."""
     items = db.query(WardrobeItem).filter(WardrobeItem.user_id == user_id).all()
-    return [
-        WardrobeItemResponse(
-            id=item.id,
-            category=item.category,
-            image_url=f"/uploads/{item.filename}",
-            bg_removed_image_url=f"/uploads/{item.bg_removed_filename}" if item.bg_removed_filename else None,
-            image_analysis=item.image_analysis
-        )
-        for item in items
-    ]
+    return [WardrobeItemResponse.from_item(item) for item in items]
 
 
 @router.delete("/{item_id}")
@@ -82,21 +269,50 @@ def delete_wardrobe_item(
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    # Delete file from disk
-    filepath = os.path.join(UPLOADS_DIR, item.filename)
-    if os.path.exists(filepath):
-        os.remove(filepath)
-        
-    if item.bg_removed_filename:
-        bg_filepath = os.path.join(UPLOADS_DIR, item.bg_removed_filename)
-        if os.path.exists(bg_filepath):
-            os.remove(bg_filepath)
+    # Files shared with other items stay until their last reference goes
+    unused_files = release_item_files(db, item)
 
     db.delete(item)
+    db.flush()
+    remove_files(unused_files)
     db.commit()
+    get_near_duplicate_index().invalidate(user_id)
     return {"detail": "Item deleted"}
 
 
+@router.get("/{item_id}/near-duplicates", response_model=List[NearDuplicateMatch])
+def get_near_duplicates(
+    item_id: int,
+    max_distance: Optional[int] = None,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """Other items of the user that look like this one, nearest first (distance in differing hash bits, 0-64)."""
+    item = db.query(WardrobeItem).filter(WardrobeItem.id == item_id, WardrobeItem.user_id == user_id).first()
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    index = get_near_duplicate_index()
+    if item.perceptual_hash is None:
+        # Uploaded before hashing existed
+        if not os.path.exists(upload_path(item.filename)):
+            return []
+        item.perceptual_hash = image_dhash(upload_path(item.filename))
+        index.invalidate(user_id)
+    matches = index.find(db, user_id, item.perceptual_hash, max_distance=max_distance, exclude_item_id=item.id)
+    db.commit()
+
+    items = {
+        match.id: match
+        for match in db.query(WardrobeItem).filter(WardrobeItem.id.in_([match_id for _, match_id in matches]))
+    }
+    return [
+        NearDuplicateMatch(distance=distance, item=WardrobeItemResponse.from_item(items[match_id]))
+        for distance, match_id in matches
+        if match_id in items
+    ]
+
+
 @router.put("/{item_id}/image-analysis", response_model=WardrobeItemResponse)
 def update_image_analysis(
     item_id: int,
@@ -114,22 +330,21 @@ def update_image_analysis(
     db.commit()
     db.refresh(item)
 
-    return WardrobeItemResponse(
-        id=item.id,
-        category=item.category,
-        image_url=f"/uploads/{item.filename}",
-        bg_removed_image_url=f"/uploads/{item.bg_removed_filename}" if item.bg_removed_filename else None,
-        image_analysis=item.image_analysis
-    )
+    return WardrobeItemResponse.from_item(item)
 
 
-@router.post("/remove-background", response_model=List[WardrobeItemResponse])
-def remove_background_batch(
+@router.post("/remove-background", response_model=BatchBackgroundRemovalResponse)
+async def remove_background_batch(
     request: BatchProcessRequest,
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
 ):
-    """Batch process wardrobe items to remove their backgrounds."""
+    """Batch process wardrobe items to remove their backgrounds.
+
+    A failed item doesn't discard the others: every cutout that was made is
+    saved. `results` reports every requested item; `items` holds the ones
+    that now have a cutout.
+    """
     items = db.query(WardrobeItem).filter(
         WardrobeItem.id.in_(request.item_ids),
         WardrobeItem.user_id == user_id
@@ -138,54 +353,61 @@ def remove_background_batch(
     if not items:
         raise HTTPException(status_code=404, detail="No items found to process")
 
-    processed_items = []
+    results_by_id: Dict[int, BackgroundRemovalItemResult] = {}
+    pending = []
     for item in items:
-        if not item.bg_removed_filename:
-            # Load original image
-            original_filepath = os.path.join(UPLOADS_DIR, item.filename)
-            if os.path.exists(original_filepath):
-                with open(original_filepath, "rb") as f:
-                    input_data = f.read()
-                
-                # Remove background
-                output_data = rembg.remove(input_data)
-                
-                # Save processed image
-                removed_bg_dir = os.path.join(UPLOADS_DIR, "removed_bg")
-                os.makedirs(removed_bg_dir, exist_ok=True)
-                
-                unique_name = f"removed_bg/processed_{uuid.uuid4().hex}.png"
-                processed_filepath = os.path.join(UPLOADS_DIR, unique_name)
-                
-                with open(processed_filepath, "wb") as f:
-                    f.write(output_data)
-                    
-                item.bg_removed_filename = unique_name
-        
-        processed_items.append(item)
-        
+        if item.bg_removed_filename:
+            results_by_id[item.id] = BackgroundRemovalItemResult(item_id=item.id, status="processed")
+        elif os.path.exists(os.path.join(UPLOADS_DIR, item.filename)):
+            pending.append(item)
+        else:
+            results_by_id[item.id] = BackgroundRemovalItemResult(item_id=item.id, status="skipped", error="Image not found")
+
+    # Nothing is written until every cutout is back, so the write lock isn't held while waiting on the engine
+    with db.no_autoflush:
+        # Queue every pending item at once; the engine batches them across its worker processes
+        outcomes = await asyncio.gather(*(remove_item_background(db, item) for item in pending), return_exceptions=True)
+        for item, outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                logger.warning(f"Background removal failed for item {item.id}: {outcome}")
+                results_by_id[item.id] = BackgroundRemovalItemResult(item_id=item.id, status="error", error=str(outcome))
+                continue
+            results_by_id[item.id] = BackgroundRemovalItemResult(item_id=item.id, status="processed")
+            try:
+                await build_item_derivatives(item, blob_for_item(db, item))
+            except Exception as e:
+                logger.warning(f"Derivatives failed for item {item.id}: {e}")
+
     db.commit()
 
-    return [
-        WardrobeItemResponse(
-            id=item.id,
-            category=item.category,
-            image_url=f"/uploads/{item.filename}",
-            bg_removed_image_url=f"/uploads/{item.bg_removed_filename}" if item.bg_removed_filename else None,
-            image_analysis=item.image_analysis
-        )
-        for item in processed_items
-    ]
+    results = [results_by_id[item.id] for item in items]
+    for result, item in zip(results, items):
+        if result.status == "processed":
+            result.item = WardrobeItemResponse.from_item(item)
+
+    return BatchBackgroundRemovalResponse(
+        items=[result.item for result in results if result.item is not None],
+        results=results,
+        processed=sum(result.status == "processed" for result in results),
+        failed=sum(result.status != "processed" for result in results),
+    )
 
 
-@router.post("/ai-analyze", response_model=List[WardrobeItemResponse])
+@router.post("/ai-analyze", response_model=BatchAnalyzeResponse)
 async def ai_analyze_batch(
     request: BatchProcessRequest,
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
 ):
-    """Batch analyze wardrobe items using Gemini AI vision."""
-    from wardrobe.services import analyze_clothing_image
+    """Batch analyze wardrobe items using Gemini AI vision.
+
+    Images are packed several to a Gemini request and the requests run
+    concurrently (WARDROBE_ANALYZE_CONCURRENCY at a time, each with a
+    WARDROBE_ANALYZE_TIMEOUT_SECONDS limit). Each result is committed as soon
+    as it arrives, so one failure doesn't discard the rest.
+    `results` reports every requested item; `items` holds the analysed ones.
+    """
+    from wardrobe.services import analyze_clothing_images
 
     items = db.query(WardrobeItem).filter(
         WardrobeItem.id.in_(request.item_ids),
@@ -195,34 +417,133 @@ async def ai_analyze_batch(
     if not items:
         raise HTTPException(status_code=404, detail="No items found to analyze")
 
-    analyzed_items = []
+    concurrency = int(os.getenv("WARDROBE_ANALYZE_CONCURRENCY", DEFAULT_ANALYZE_CONCURRENCY))
+    timeout = float(os.getenv("WARDROBE_ANALYZE_TIMEOUT_SECONDS", DEFAULT_ANALYZE_TIMEOUT_SECONDS))
+
+    results_by_id: Dict[int, AnalyzeItemResult] = {}
+    images = []
     for item in items:
         # Prefer bg-removed image for cleaner analysis, fall back to original
-        if item.bg_removed_filename:
-            image_path = os.path.join(UPLOADS_DIR, item.bg_removed_filename)
+        image_path = upload_path(item.bg_removed_filename or item.filename)
+        if os.path.exists(image_path):
+            images.append((item.id, image_path))
         else:
-            image_path = os.path.join(UPLOADS_DIR, item.filename)
-
-        if not os.path.exists(image_path):
+            results_by_id[item.id] = AnalyzeItemResult(item_id=item.id, status="skipped", error="Image not found")
+
+    items_by_id = {item.id: item for item in items}
+    rejected: List[AdmissionRejected] = []
+    async for item_id, analysis in analyze_clothing_images(images, concurrency=concurrency, timeout=timeout, user_id=user_id):
+        item = items_by_id[item_id]
+        if isinstance(analysis, AdmissionRejected):
+            rejected.append(analysis)
+        if isinstance(analysis, Exception):
+            logger.warning(f"AI analysis failed for item {item_id}: {analysis}")
+            results_by_id[item_id] = AnalyzeItemResult(item_id=item_id, status="error", error=str(analysis))
             continue
+        item.image_analysis = with_local_colors(analysis, item.colors)
+        db.commit()
+        results_by_id[item_id] = AnalyzeItemResult(item_id=item_id, status="analyzed", item=WardrobeItemResponse.from_item(item))
+
+    if rejected and len(rejected) == len(images):
+        # Nothing got through admission control: tell the client when to come back instead of listing failures
+        soonest = min(rejected, key=lambda exc: exc.retry_after)
+        raise HTTPException(status_code=429, detail=str(soonest), headers={"Retry-After": soonest.retry_after_header})
+
+    results = [results_by_id[item.id] for item in items]
+
+    return BatchAnalyzeResponse(
+        items=[result.item for result in results if result.item is not None],
+        results=results,
+        analyzed=sum(result.status == "analyzed" for result in results),
+        failed=sum(result.status != "analyzed" for result in results),
+    )
 
-        try:
-            analysis = await analyze_clothing_image(image_path)
-            item.image_analysis = analysis
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"AI analysis failed for item {item.id}: {str(e)}")
 
-        analyzed_items.append(item)
+def _get_job(db: Session, job_id: int, user_id: int) -> IngestionJob:
+    job = db.query(IngestionJob).filter(IngestionJob.id == job_id, IngestionJob.user_id == user_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
-    db.commit()
 
-    return [
-        WardrobeItemResponse(
-            id=item.id,
-            category=item.category,
-            image_url=f"/uploads/{item.filename}",
-            bg_removed_image_url=f"/uploads/{item.bg_removed_filename}" if item.bg_removed_filename else None,
-            image_analysis=item.image_analysis
-        )
-        for item in analyzed_items
-    ]
+@router.post("/ingest", response_model=IngestionJobResponse)
+def ingest_wardrobe_items(
+    request: BatchProcessRequest,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """Queue background removal and AI analysis for existing items that are missing either."""
+    items = db.query(WardrobeItem).filter(
+        WardrobeItem.id.in_(request.item_ids),
+        WardrobeItem.user_id == user_id
+    ).all()
+
+    if not items:
+        raise HTTPException(status_code=404, detail="No items found to process")
+
+    job = create_job(db, user_id, items)
+    get_ingestion_pipeline().enqueue_job(db, job)
+    return job_snapshot(db, job)
+
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+def get_ingestion_job(
+    job_id: int,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """Per-item stage status of an ingestion job."""
+    return job_snapshot(db, _get_job(db, job_id, user_id))
+
+
+@router.post("/jobs/{job_id}/retry", response_model=IngestionJobResponse)
+def retry_ingestion_job(
+    job_id: int,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """Re-run the failed stages of a job. Stages that already completed are not repeated."""
+    job = _get_job(db, job_id, user_id)
+    get_ingestion_pipeline().retry(db, job)
+    return job_snapshot(db, job)
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_ingestion_job(
+    job_id: int,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """Server-sent events: a `snapshot` of the job, a `stage` event per stage change, and `done` when it settles."""
+    job = _get_job(db, job_id, user_id)
+    events = get_ingestion_pipeline().events
+    # Subscribe before taking the snapshot so no change falls between the two.
+    queue = events.subscribe(job_id)
+    snapshot = jsonable_encoder(job_snapshot(db, job))
+    db.close()
+
+    def _sse(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    async def _events():
+        try:
+            yield _sse("snapshot", snapshot)
+            status = snapshot["status"]
+            while status not in (COMPLETED, FAILED):
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse("stage", event)
+                status = event["job_status"]
+
+            session = SessionLocal()
+            try:
+                yield _sse("done", jsonable_encoder(job_snapshot(session, session.get(IngestionJob, job_id))))
+            finally:
+                session.close()
+        finally:
+            events.unsubscribe(job_id, queue)
+
+    return StreamingResponse(_events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
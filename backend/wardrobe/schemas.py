@@ -1,5 +1,8 @@
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
+from datetime import datetime
+
+from wardrobe.storage import upload_url
 
 
 class ImageAnalysisData(BaseModel):
@@ -19,11 +22,102 @@ class WardrobeItemResponse(BaseModel):
     category: str
     image_url: str
     bg_removed_image_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    medium_url: Optional[str] = None
+    bg_removed_thumbnail_url: Optional[str] = None
+    bg_removed_medium_url: Optional[str] = None
     image_analysis: Optional[Dict[str, Any]] = None
+    colors: Optional[List[Dict[str, Any]]] = None
+    near_duplicate_of: Optional[int] = None
+    job_id: Optional[int] = None
 
     class Config:
         from_attributes = True
 
+    @classmethod
+    def from_item(cls, item, job_id: Optional[int] = None):
+        derivatives = item.derivatives or {}
+        return cls(
+            id=item.id,
+            category=item.category,
+            image_url=upload_url(item.filename),
+            bg_removed_image_url=upload_url(item.bg_removed_filename),
+            thumbnail_url=upload_url(derivatives.get("thumb")),
+            medium_url=upload_url(derivatives.get("medium")),
+            bg_removed_thumbnail_url=upload_url(derivatives.get("cutout_thumb")),
+            bg_removed_medium_url=upload_url(derivatives.get("cutout_medium")),
+            image_analysis=item.image_analysis,
+            colors=item.colors,
+            near_duplicate_of=item.near_duplicate_of_id,
+            job_id=job_id,
+        )
+
+
+class NearDuplicateMatch(BaseModel):
+    distance: int
+    item: WardrobeItemResponse
+
 
 class BatchProcessRequest(BaseModel):
     item_ids: List[int]
+
+
+class AnalyzeItemResult(BaseModel):
+    item_id: int
+    status: str  # analyzed, error or skipped
+    item: Optional[WardrobeItemResponse] = None
+    error: Optional[str] = None
+
+
+class BatchAnalyzeResponse(BaseModel):
+    items: List[WardrobeItemResponse]
+    results: List[AnalyzeItemResult]
+    analyzed: int
+    failed: int
+
+
+class BackgroundRemovalItemResult(BaseModel):
+    item_id: int
+    status: str  # processed, error or skipped
+    item: Optional[WardrobeItemResponse] = None
+    error: Optional[str] = None
+
+
+class BatchBackgroundRemovalResponse(BaseModel):
+    items: List[WardrobeItemResponse]
+    results: List[BackgroundRemovalItemResult]
+    processed: int
+    failed: int
+
+
+class BulkUploadResult(BaseModel):
+    index: int
+    filename: Optional[str] = None
+    status: str  # created or error
+    item: Optional[WardrobeItemResponse] = None
+    error: Optional[str] = None
+
+
+class BulkUploadResponse(BaseModel):
+    job_id: Optional[int] = None
+    created: int
+    failed: int
+    results: List[BulkUploadResult]
+
+
+class IngestionStageStatus(BaseModel):
+    status: str
+    attempts: int
+    error: Optional[str] = None
+
+
+class IngestionItemStatus(BaseModel):
+    item_id: int
+    stages: Dict[str, IngestionStageStatus]
+
+
+class IngestionJobResponse(BaseModel):
+    id: int
+    status: str
+    created_at: Optional[datetime] = None
+    items: List[IngestionItemStatus]
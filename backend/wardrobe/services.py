@@ -1,109 +1,385 @@
 import asyncio
-import base64
+import copy
+import hashlib
+import io
 import json
 import logging
+import math
 import os
+from typing import AsyncIterator, Hashable
+
+from PIL import Image, ImageOps
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import SessionLocal
+from genai_clients import get_genai_clients
+from llm_admission import BULK, get_llm_admission
+from ttl_cache import TTLCache
+from wardrobe.models import AnalysisCacheEntry
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_ANALYSIS_MAX_EDGE = 1024
+ANALYSIS_JPEG_QUALITY = 85
+
+# Prepared (downscaled, re-encoded) payloads, keyed by file identity and target size.
+prepared_image_cache = TTLCache(
+    max_entries=int(os.getenv("WARDROBE_ANALYSIS_IMAGE_CACHE_MAX_ENTRIES", 64)),
+    ttl=float(os.getenv("WARDROBE_ANALYSIS_IMAGE_CACHE_TTL_SECONDS", 3600)),
+)
+
+ANALYSIS_MODEL = "gemini-2.0-flash"
+ANALYSIS_TEMPERATURE = 0.3
+ANALYSIS_MAX_OUTPUT_TOKENS = 512
+
+ANALYSIS_PROMPT = (
+    "You are a fashion expert analyzing a clothing item image. "
+    "Examine this clothing item carefully and provide a detailed analysis.\n\n"
+    "You MUST respond with ONLY a valid JSON object (no markdown, no explanation, no extra text) "
+    "with exactly these keys:\n"
+    '{\n'
+    '  "type": "the specific garment type, e.g. t-shirt, blouse, jeans, sneakers, blazer, hoodie, skirt",\n'
+    '  "neckline": "e.g. crew neck, v-neck, polo, turtleneck, scoop, no neck, collared. Use \'N/A\' for non-top items",\n'
+    '  "sleevelength": "e.g. sleeveless, short, 3/4, long, N/A for non-top items",\n'
+    '  "primaryColor": "the dominant color of the garment",\n'
+    '  "secondaryColors": "other visible colors, comma-separated, or \'none\' if solid color",\n'
+    '  "fit": "e.g. slim, regular, relaxed, oversized, tailored",\n'
+    '  "length": "e.g. cropped, regular, knee-length, full-length, ankle",\n'
+    '  "fabricType": "e.g. cotton, denim, wool, silk, polyester, leather, linen, knit",\n'
+    '  "texture": "e.g. smooth, ribbed, chunky, flowy, structured, fuzzy, distressed"\n'
+    '}\n\n'
+    "Be specific and accurate. Respond with ONLY the JSON object."
+)
+
+EXPECTED_KEYS = [
+    "type", "neckline", "sleevelength", "primaryColor",
+    "secondaryColors", "fit", "length", "fabricType", "texture"
+]
+
+BATCH_ANALYSIS_PROMPT = (
+    "You are a fashion expert analyzing several clothing item images. "
+    "Each image is preceded by a label of the form 'Item <id>:'. "
+    "Examine each clothing item carefully and provide a detailed analysis of it.\n\n"
+    "You MUST respond with ONLY a valid JSON array (no markdown, no explanation, no extra text) "
+    "containing one object per image, in any order. Each object has an \"item_id\" key holding the "
+    "image's label id as a string, plus exactly the keys of this object:\n"
+    + ANALYSIS_PROMPT[ANALYSIS_PROMPT.index("{"):ANALYSIS_PROMPT.rindex("}") + 1]
+    + "\n\nBe specific and accurate. Respond with ONLY the JSON array."
+)
+
+# Rough Gemini accounting used to size batches: each started 768px tile of an image costs
+# about 258 input tokens, and one item's JSON answer stays well under 200 output tokens.
+TOKENS_PER_IMAGE_TILE = 258
+OUTPUT_TOKENS_PER_ITEM = 200
+DEFAULT_BATCH_MAX_ITEMS = 8
+DEFAULT_BATCH_MAX_INPUT_TOKENS = 16000
+DEFAULT_BATCH_MAX_OUTPUT_TOKENS = 4096
+
+
+def analysis_max_edge() -> int:
+    return int(os.getenv("WARDROBE_ANALYSIS_MAX_EDGE", DEFAULT_ANALYSIS_MAX_EDGE))
+
+
+# Changes to the prompt, model, generation or preprocessing settings change the version, so older cache entries stop matching.
+ANALYSIS_VERSION = hashlib.sha256(
+    json.dumps([
+        ANALYSIS_MODEL, ANALYSIS_PROMPT, BATCH_ANALYSIS_PROMPT, ANALYSIS_TEMPERATURE, ANALYSIS_MAX_OUTPUT_TOKENS,
+        analysis_max_edge(), ANALYSIS_JPEG_QUALITY,
+    ]).encode("utf-8")
+).hexdigest()[:16]
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _encode_analysis_image(image_path: str, max_edge: int) -> bytes:
+    with Image.open(image_path) as source:
+        # JPEG sources are downscaled during decoding when they are much larger than needed.
+        source.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(source)
+        if image.mode in ("RGBA", "LA", "P"):
+            # Cutouts: put the garment on white so the model isn't shown a black background.
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
 
-async def analyze_clothing_image(image_path: str) -> dict:
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=ANALYSIS_JPEG_QUALITY, optimize=True)
+        return buffer.getvalue()
+
+
+async def prepare_analysis_image(image_path: str) -> tuple[bytes, str]:
+    """Decode the image once, apply EXIF orientation, fit it within the max edge and re-encode as JPEG.
+
+    Returns (payload, mime type). Payloads are cached per file and size, so
+    re-analysing the same image skips the decode.
+    """
+    max_edge = analysis_max_edge()
+    stat = os.stat(image_path)
+    key = (image_path, stat.st_mtime_ns, stat.st_size, max_edge)
+    payload = prepared_image_cache.get(key)
+    if payload is None:
+        payload = await asyncio.to_thread(_encode_analysis_image, image_path, max_edge)
+        prepared_image_cache.set(key, payload)
+    return payload, "image/jpeg"
+
+
+def get_cached_analysis(image_hash: str) -> dict | None:
+    db = SessionLocal()
+    try:
+        entry = db.query(AnalysisCacheEntry).filter(
+            AnalysisCacheEntry.image_hash == image_hash,
+            AnalysisCacheEntry.analysis_version == ANALYSIS_VERSION,
+        ).first()
+        return copy.deepcopy(entry.analysis) if entry else None
+    finally:
+        db.close()
+
+
+def store_cached_analysis(image_hash: str, analysis: dict) -> None:
+    db = SessionLocal()
+    try:
+        statement = sqlite_insert(AnalysisCacheEntry).values(
+            image_hash=image_hash,
+            analysis_version=ANALYSIS_VERSION,
+            analysis=analysis,
+        )
+        db.execute(statement.on_conflict_do_nothing(index_elements=["image_hash", "analysis_version"]))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _strip_code_fence(text: str) -> str:
+    text = text.strip()
+    # Handle cases where the model wraps in ```json blocks
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0].strip()
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0].strip()
+    return text
+
+
+def _complete_attributes(parsed: dict) -> dict:
+    # Ensure all expected keys exist
+    for key in EXPECTED_KEYS:
+        if key not in parsed:
+            parsed[key] = ""
+    return parsed
+
+
+async def analyze_clothing_image(image_path: str, priority: int = BULK, user_id: int | None = None) -> dict:
     """
     Analyze a clothing image using Gemini 2.0 Flash multimodal vision.
     Returns a dict with keys: type, neckline, sleevelength, primaryColor,
     secondaryColors, fit, length, fabricType, texture.
-    """
-    project_id = os.environ.get("GOOGLE_CLOUD_PROJECT")
-    location = os.environ.get("GOOGLE_CLOUD_LOCATION", "us-central1")
-
-    if not project_id:
-        raise ValueError("GOOGLE_CLOUD_PROJECT environment variable is missing.")
 
+    The image is downscaled and re-encoded before it is sent (see
+    prepare_analysis_image). Results are cached by the image's SHA-256 and
+    ANALYSIS_VERSION, so the same bytes are only sent to Gemini once per
+    prompt/model version. The call goes through LLM admission control at
+    `priority`, charged to `user_id` if given.
+    """
     if not os.path.exists(image_path):
         raise FileNotFoundError(f"Image not found: {image_path}")
 
-    # Read the image file and encode as base64
-    with open(image_path, "rb") as f:
-        image_bytes = f.read()
+    image_hash = await asyncio.to_thread(file_sha256, image_path)
+    cached = get_cached_analysis(image_hash)
+    if cached is not None:
+        return cached
+
+    models = get_genai_clients().models
+    image_bytes, mime_type = await prepare_analysis_image(image_path)
+
+    from google.genai import types
+
+    async with get_llm_admission().slot(ANALYSIS_MODEL, priority, user_id):
+        try:
+            result = await models.generate_content(
+                model=ANALYSIS_MODEL,
+                contents=[
+                    types.Content(
+                        role="user",
+                        parts=[
+                            types.Part.from_bytes(data=image_bytes, mime_type=mime_type),
+                            types.Part.from_text(text=ANALYSIS_PROMPT),
+                        ],
+                    )
+                ],
+                config=types.GenerateContentConfig(
+                    temperature=ANALYSIS_TEMPERATURE,
+                    max_output_tokens=ANALYSIS_MAX_OUTPUT_TOKENS,
+                ),
+            )
+            text = _strip_code_fence(result.text)
+
+            parsed = _complete_attributes(json.loads(text))
+
+            store_cached_analysis(image_hash, parsed)
+            return parsed
+
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse Gemini response as JSON: {text}", exc_info=True)
+            raise ValueError(f"AI analysis returned invalid JSON: {e}")
+        except Exception as e:
+            logger.error(f"Gemini clothing analysis failed: {e}", exc_info=True)
+            raise
+
+
+def _estimated_input_tokens(image_bytes: bytes) -> int:
+    width, height = Image.open(io.BytesIO(image_bytes)).size
+    return TOKENS_PER_IMAGE_TILE * math.ceil(width / 768) * math.ceil(height / 768) + 10
+
+
+def plan_analysis_batches(payloads: list[tuple[Hashable, bytes]]) -> list[list[Hashable]]:
+    """Group images into batches that stay within the item, input-token and output-token budgets."""
+    max_items = int(os.getenv("WARDROBE_ANALYSIS_BATCH_MAX_ITEMS", DEFAULT_BATCH_MAX_ITEMS))
+    max_input = int(os.getenv("WARDROBE_ANALYSIS_BATCH_MAX_INPUT_TOKENS", DEFAULT_BATCH_MAX_INPUT_TOKENS))
+    max_output = int(os.getenv("WARDROBE_ANALYSIS_BATCH_MAX_OUTPUT_TOKENS", DEFAULT_BATCH_MAX_OUTPUT_TOKENS))
+    max_items = max(1, min(max_items, max_output // OUTPUT_TOKENS_PER_ITEM))
+
+    prompt_tokens = len(BATCH_ANALYSIS_PROMPT) // 4
+    batches: list[list[Hashable]] = []
+    current: list[Hashable] = []
+    current_tokens = prompt_tokens
+    for key, image_bytes in payloads:
+        tokens = _estimated_input_tokens(image_bytes)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_input):
+            batches.append(current)
+            current, current_tokens = [], prompt_tokens
+        current.append(key)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
 
-    image_b64 = base64.b64encode(image_bytes).decode("utf-8")
 
-    # Determine MIME type from extension
-    ext = os.path.splitext(image_path)[1].lower()
-    mime_map = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
-    mime_type = mime_map.get(ext, "image/jpeg")
+class BatchResponseError(ValueError):
+    """The model answered a batched request, but not in a form the answers can be read from."""
+
+
+async def _analyze_batch(images: list[tuple[Hashable, bytes, str]], user_id: int | None = None) -> dict[str, dict]:
+    """One multimodal request for several prepared images; returns the parsed answers keyed by str(item key)."""
+    models = get_genai_clients().models
 
-    from google import genai
     from google.genai import types
 
-    prompt = (
-        "You are a fashion expert analyzing a clothing item image. "
-        "Examine this clothing item carefully and provide a detailed analysis.\n\n"
-        "You MUST respond with ONLY a valid JSON object (no markdown, no explanation, no extra text) "
-        "with exactly these keys:\n"
-        '{\n'
-        '  "type": "the specific garment type, e.g. t-shirt, blouse, jeans, sneakers, blazer, hoodie, skirt",\n'
-        '  "neckline": "e.g. crew neck, v-neck, polo, turtleneck, scoop, no neck, collared. Use \'N/A\' for non-top items",\n'
-        '  "sleevelength": "e.g. sleeveless, short, 3/4, long, N/A for non-top items",\n'
-        '  "primaryColor": "the dominant color of the garment",\n'
-        '  "secondaryColors": "other visible colors, comma-separated, or \'none\' if solid color",\n'
-        '  "fit": "e.g. slim, regular, relaxed, oversized, tailored",\n'
-        '  "length": "e.g. cropped, regular, knee-length, full-length, ankle",\n'
-        '  "fabricType": "e.g. cotton, denim, wool, silk, polyester, leather, linen, knit",\n'
-        '  "texture": "e.g. smooth, ribbed, chunky, flowy, structured, fuzzy, distressed"\n'
-        '}\n\n'
-        "Be specific and accurate. Respond with ONLY the JSON object."
-    )
-
-    def _ask_gemini():
-        c = genai.Client(
-            vertexai=True,
-            project=project_id,
-            location=location,
-        )
-        return c.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[
-                types.Content(
-                    role="user",
-                    parts=[
-                        types.Part.from_bytes(data=image_bytes, mime_type=mime_type),
-                        types.Part.from_text(text=prompt),
-                    ],
-                )
-            ],
+    parts = []
+    for key, image_bytes, mime_type in images:
+        parts.append(types.Part.from_text(text=f"Item {key}:"))
+        parts.append(types.Part.from_bytes(data=image_bytes, mime_type=mime_type))
+    parts.append(types.Part.from_text(text=BATCH_ANALYSIS_PROMPT))
+
+    async with get_llm_admission().slot(ANALYSIS_MODEL, BULK, user_id):
+        result = await models.generate_content(
+            model=ANALYSIS_MODEL,
+            contents=[types.Content(role="user", parts=parts)],
             config=types.GenerateContentConfig(
-                temperature=0.3,
-                max_output_tokens=512,
+                temperature=ANALYSIS_TEMPERATURE,
+                max_output_tokens=max(ANALYSIS_MAX_OUTPUT_TOKENS, OUTPUT_TOKENS_PER_ITEM * len(images)),
             ),
         )
-
     try:
-        result = await asyncio.to_thread(_ask_gemini)
-        text = result.text.strip()
+        parsed = json.loads(_strip_code_fence(result.text))
+    except json.JSONDecodeError as e:
+        raise BatchResponseError(f"Batched AI analysis returned invalid JSON: {e}")
+    if not isinstance(parsed, list):
+        raise BatchResponseError("Batched AI analysis did not return a JSON array")
 
-        # Handle cases where the model wraps in ```json blocks
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0].strip()
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0].strip()
+    answers = {}
+    for entry in parsed:
+        if isinstance(entry, dict) and "item_id" in entry:
+            item_key = str(entry.pop("item_id")).removeprefix("Item ").strip()
+            answers[item_key] = _complete_attributes(entry)
+    return answers
 
-        parsed = json.loads(text)
 
-        # Ensure all expected keys exist
-        expected_keys = [
-            "type", "neckline", "sleevelength", "primaryColor",
-            "secondaryColors", "fit", "length", "fabricType", "texture"
-        ]
-        for key in expected_keys:
-            if key not in parsed:
-                parsed[key] = ""
+async def analyze_clothing_images(
+    images: list[tuple[Hashable, str]],
+    concurrency: int = 4,
+    timeout: float = 60.0,
+    user_id: int | None = None,
+) -> AsyncIterator[tuple[Hashable, dict | Exception]]:
+    """Analyse many images, packing several into each Gemini request.
 
-        return parsed
+    Yields (key, attributes or exception) for every input as results arrive:
+    cache hits first, then each batch as it completes. Images are batched
+    within the budgets of plan_analysis_batches; images a batch answer leaves
+    out (or all of them, if the answer can't be parsed) fall back to
+    single-image calls. A batch that times out, fails or is rejected by
+    admission control reports that error for each of its images.
+    Model calls are admitted at BULK priority and charged to `user_id`.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    paths = dict(images)
+    hashes: dict[Hashable, str] = {}
+    payloads: dict[Hashable, tuple[bytes, str]] = {}
 
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse Gemini response as JSON: {text}", exc_info=True)
-        raise ValueError(f"AI analysis returned invalid JSON: {e}")
-    except Exception as e:
-        logger.error(f"Gemini clothing analysis failed: {e}", exc_info=True)
-        raise
+    for key, path in images:
+        try:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Image not found: {path}")
+            hashes[key] = await asyncio.to_thread(file_sha256, path)
+            cached = get_cached_analysis(hashes[key])
+            if cached is not None:
+                yield key, cached
+                continue
+            payloads[key] = await prepare_analysis_image(path)
+        except Exception as exc:
+            yield key, exc
+
+    async def _single(key: Hashable) -> dict | Exception:
+        try:
+            async with semaphore:
+                return await asyncio.wait_for(analyze_clothing_image(paths[key], BULK, user_id), timeout)
+        except asyncio.TimeoutError:
+            return TimeoutError(f"Timed out after {timeout:g}s")
+        except Exception as exc:
+            return exc
+
+    async def _run(batch: list[Hashable]) -> list[tuple[Hashable, dict | Exception]]:
+        if len(batch) == 1:
+            return [(batch[0], await _single(batch[0]))]
+
+        answers: dict[str, dict] = {}
+        try:
+            async with semaphore:
+                answers = await asyncio.wait_for(
+                    _analyze_batch([(key, *payloads[key]) for key in batch], user_id),
+                    timeout,
+                )
+        except BatchResponseError as exc:
+            logger.warning(f"Batched clothing analysis of {len(batch)} images was unreadable, falling back to single calls: {exc}")
+        except asyncio.TimeoutError:
+            error = TimeoutError(f"Timed out after {timeout:g}s")
+            return [(key, error) for key in batch]
+        except Exception as exc:
+            # Rejected by admission control or the model call failed: one call per image would only multiply the load
+            logger.warning(f"Batched clothing analysis of {len(batch)} images failed: {exc!r}")
+            return [(key, exc) for key in batch]
+
+        results = []
+        missing = []
+        for key in batch:
+            answer = answers.get(str(key))
+            if answer is None:
+                missing.append(key)
+                continue
+            store_cached_analysis(hashes[key], answer)
+            results.append((key, copy.deepcopy(answer)))
+        if missing:
+            logger.info(f"Batched clothing analysis dropped {len(missing)}/{len(batch)} images, retrying them one by one")
+            singles = await asyncio.gather(*(_single(key) for key in missing))
+            results.extend(zip(missing, singles))
+        return results
+
+    batches = plan_analysis_batches([(key, payload) for key, (payload, _) in payloads.items()])
+    for finished in asyncio.as_completed([_run(batch) for batch in batches]):
+        for key, result in await finished:
+            yield key, result
@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+
+from fastapi import UploadFile
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from wardrobe.models import ImageBlob, WardrobeItem
+
+# --- Uploads directory ---
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPLOADS_DIR = os.path.join(BASE_DIR, "uploads")
+os.makedirs(UPLOADS_DIR, exist_ok=True)
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_UPLOAD_BYTES = 15 * 1024 * 1024
+
+
+def upload_path(filename: str) -> str:
+    """Absolute path of a file stored under the uploads directory."""
+    return os.path.join(UPLOADS_DIR, filename)
+
+
+def blob_filename(content_hash: str, ext: str) -> str:
+    """Content-addressed location of an uploaded image, e.g. blobs/ab/ab12...ef.jpg."""
+    return f"blobs/{content_hash[:2]}/{content_hash}{ext}"
+
+
+def upload_url(filename: str | None) -> str | None:
+    """Public URL of an uploads-relative filename, or None."""
+    return f"/uploads/{filename}" if filename else None
+
+
+def max_upload_bytes() -> int:
+    return int(os.getenv("WARDROBE_MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD_BYTES))
+
+
+class UploadRejected(ValueError):
+    """An upload that was refused; `status_code` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class StoredUpload:
+    filename: str
+    size: int
+    content_hash: str
+    content_type: str
+    deduplicated: bool = False
+    # When deduplicated: this upload's own copy, kept until acquire_blob in case the shared file is deleted meanwhile
+    spare_filename: str | None = None
+
+
+def sniff_image_type(head: bytes) -> tuple[str, str] | None:
+    """(content type, extension) from an image's leading bytes, or None if it isn't a supported format."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg", ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png", ".png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", ".webp"
+    return None
+
+
+async def save_upload(file: UploadFile, max_bytes: int | None = None) -> StoredUpload:
+    """Stream an uploaded image to disk in fixed-size chunks, hashing it on the way.
+
+    The type comes from the first bytes rather than the client's filename or
+    header, and the copy stops as soon as the size limit is crossed. Disk
+    writes run in a thread so the event loop is never blocked on I/O. On any
+    failure the partial file is removed.
+
+    The file ends up at its content-addressed path. If identical bytes are
+    already stored there, `deduplicated` is set and the new copy is kept
+    aside as `spare_filename` until acquire_blob has registered the upload.
+    """
+    max_bytes = max_bytes or max_upload_bytes()
+    if file.size is not None and file.size > max_bytes:
+        raise UploadRejected(f"File is larger than {max_bytes} bytes", status_code=413)
+
+    first_chunk = await file.read(CHUNK_SIZE)
+    sniffed = sniff_image_type(first_chunk[:16])
+    if sniffed is None:
+        raise UploadRejected("Unsupported image type. Upload a JPEG, PNG or WebP image", status_code=415)
+    content_type, ext = sniffed
+
+    partial_path = upload_path(f"{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+
+    handle = await asyncio.to_thread(open, partial_path, "wb")
+    try:
+        chunk = first_chunk
+        while chunk:
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadRejected(f"File is larger than {max_bytes} bytes", status_code=413)
+            digest.update(chunk)
+            await asyncio.to_thread(handle.write, chunk)
+            chunk = await file.read(CHUNK_SIZE)
+        await asyncio.to_thread(handle.close)
+
+        content_hash = digest.hexdigest()
+        filename = blob_filename(content_hash, ext)
+        final_path = upload_path(filename)
+        deduplicated = os.path.exists(final_path)
+        if not deduplicated:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            await asyncio.to_thread(os.replace, partial_path, final_path)
+    except BaseException:
+        handle.close()
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    return StoredUpload(
+        filename=filename,
+        size=size,
+        content_hash=content_hash,
+        content_type=content_type,
+        deduplicated=deduplicated,
+        spare_filename=os.path.basename(partial_path) if deduplicated else None,
+    )
+
+
+def acquire_blob(db: Session, stored: StoredUpload) -> ImageBlob:
+    """Register one more reference to a stored upload, creating its blob row on first use."""
+    db.execute(
+        sqlite_insert(ImageBlob)
+        .values(
+            content_hash=stored.content_hash,
+            filename=stored.filename,
+            size=stored.size,
+            content_type=stored.content_type,
+            ref_count=0,
+        )
+        .on_conflict_do_nothing(index_elements=["content_hash"])
+    )
+    db.query(ImageBlob).filter(ImageBlob.content_hash == stored.content_hash).update(
+        {ImageBlob.ref_count: ImageBlob.ref_count + 1}, synchronize_session=False
+    )
+    blob = db.query(ImageBlob).filter(ImageBlob.content_hash == stored.content_hash).populate_existing().one()
+
+    # The writes above hold the database write lock, so a delete of the last other reference has either
+    # committed (and unlinked the shared file) or will see this reference. Put the file back if it went.
+    if stored.spare_filename:
+        if not _exists(blob.filename):
+            os.replace(upload_path(stored.spare_filename), upload_path(blob.filename))
+        remove_files([stored.spare_filename])
+        stored.spare_filename = None
+    return blob
+
+
+def new_item(user_id: int, category: str, stored: StoredUpload, blob: ImageBlob) -> WardrobeItem:
+    """A WardrobeItem for a stored upload that starts with whatever artefacts its blob already has."""
+    return WardrobeItem(
+        user_id=user_id,
+        category=category,
+        filename=blob.filename,
+        content_hash=stored.content_hash,
+        bg_removed_filename=blob.bg_removed_filename if _exists(blob.bg_removed_filename) else None,
+        derivatives=blob.derivatives if blob.derivatives and all(_exists(name) for name in blob.derivatives.values()) else None,
+    )
+
+
+def blob_for_item(db: Session, item: WardrobeItem) -> ImageBlob | None:
+    """The blob an item's original is stored in, or None for items saved before content addressing."""
+    if not item.content_hash:
+        return None
+    blob = db.query(ImageBlob).filter(ImageBlob.content_hash == item.content_hash).first()
+    if blob is None or blob.filename != item.filename:
+        return None
+    return blob
+
+
+def release_item_files(db: Session, item: WardrobeItem) -> list[str]:
+    """Drop the item's reference to its stored files and return the ones nobody uses any more.
+
+    Flush, then delete the returned files before committing: the pending
+    writes hold the database write lock, so an upload of the same bytes
+    can't register a new reference to them in between (see acquire_blob).
+    """
+    blob = blob_for_item(db, item)
+    if blob is None:
+        # Legacy item: it owns its files outright.
+        return [name for name in (item.filename, item.bg_removed_filename, *(item.derivatives or {}).values()) if name]
+
+    blob.ref_count -= 1
+    if blob.ref_count > 0:
+        return []
+
+    files = {blob.filename, blob.bg_removed_filename, *(blob.derivatives or {}).values()}
+    db.delete(blob)
+    return [name for name in files if name]
+
+
+def remove_files(filenames: list[str]) -> None:
+    for filename in filenames:
+        path = upload_path(filename)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _exists(filename: str | None) -> bool:
+    return bool(filename) and os.path.exists(upload_path(filename))
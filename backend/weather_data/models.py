@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import Column, DateTime, DATE, Float, ForeignKey, Integer, String
+from sqlalchemy import Column, DateTime, DATE, Float, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import relationship
 
 from database import Base
@@ -8,6 +8,10 @@ from database import Base
 
 class WeatherData(Base):
     __tablename__ = "weather_data"
+    __table_args__ = (
+        Index("uq_weather_data_location_date", "location_id", "forecast_date", unique=True),
+        Index("ix_weather_data_geo_bucket_date", "geo_bucket", "forecast_date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     location_id = Column(Integer, ForeignKey("locations.id"), nullable=False, index=True)
@@ -19,5 +23,6 @@ class WeatherData(Base):
     weather_condition = Column(String, nullable=False)
     raw_response_json = Column(String, nullable=True)
     fetched_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    geo_bucket = Column(String, nullable=True)
 
     location = relationship("Location")
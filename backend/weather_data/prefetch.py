@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from location.models import Location
+from outfit_request.models import OutfitRequest
+from wardrobe_suggestion_history.models import WardrobeSuggestionHistory
+from weather_data.services import env_int, forecast_needs_refresh, geo_bucket_for, refresh_forecast
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFETCH_INTERVAL_SECONDS = 45 * 60
+DEFAULT_PREFETCH_JITTER = 0.2
+DEFAULT_PREFETCH_ACTIVE_DAYS = 7
+DEFAULT_PREFETCH_CONCURRENCY = 4
+
+
+def active_locations(db: Session, since: datetime) -> list[Location]:
+    """Locations used by outfit requests or wardrobe suggestions since `since`, one per geo bucket."""
+    location_ids = {
+        location_id
+        for (location_id,) in db.query(OutfitRequest.location_id).filter(OutfitRequest.created_at >= since).distinct()
+    }
+    location_ids.update(
+        location_id
+        for (location_id,) in db.query(WardrobeSuggestionHistory.location_id).filter(
+            WardrobeSuggestionHistory.created_at >= since
+        ).distinct()
+    )
+    if not location_ids:
+        return []
+
+    locations_by_bucket: dict[str, Location] = {}
+    for location in db.query(Location).filter(Location.id.in_(location_ids)).order_by(Location.id):
+        locations_by_bucket.setdefault(geo_bucket_for(location), location)
+    return list(locations_by_bucket.values())
+
+
+class ForecastPrefetcher:
+    """Periodically refreshes forecasts for recently active locations ahead of user requests."""
+
+    def __init__(self):
+        self.interval = env_int("WEATHER_PREFETCH_INTERVAL_SECONDS", DEFAULT_PREFETCH_INTERVAL_SECONDS)
+        self.active_days = env_int("WEATHER_PREFETCH_ACTIVE_DAYS", DEFAULT_PREFETCH_ACTIVE_DAYS)
+        self.concurrency = max(1, env_int("WEATHER_PREFETCH_CONCURRENCY", DEFAULT_PREFETCH_CONCURRENCY))
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _next_delay(self) -> float:
+        jitter = self.interval * DEFAULT_PREFETCH_JITTER
+        return max(1.0, self.interval + random.uniform(-jitter, jitter))
+
+    async def _run(self) -> None:
+        # Stagger the first pass so several workers started together don't hit the API at once.
+        await asyncio.sleep(random.uniform(0, min(60.0, self._next_delay())))
+        while True:
+            try:
+                await self.run_once()
+            except Exception as exc:
+                logger.warning(f"Weather prefetch pass failed: {exc}")
+            await asyncio.sleep(self._next_delay())
+
+    async def run_once(self) -> int:
+        """Refresh every active location whose forecast would go stale before the next pass."""
+        since = datetime.now(timezone.utc) - timedelta(days=self.active_days)
+        horizon = timedelta(seconds=self.interval * (1 + DEFAULT_PREFETCH_JITTER))
+
+        db = SessionLocal()
+        try:
+            location_ids = [
+                location.id
+                for location in active_locations(db, since)
+                if forecast_needs_refresh(db, location, within=horizon)
+            ]
+        finally:
+            db.close()
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def _refresh(location_id: int) -> bool:
+            async with semaphore:
+                db = SessionLocal()
+                try:
+                    location = db.query(Location).filter(Location.id == location_id).first()
+                    if location is None:
+                        return False
+                    await refresh_forecast(db, location)
+                    return True
+                except Exception as exc:
+                    logger.warning(f"Weather prefetch failed for location {location_id}: {exc}")
+                    return False
+                finally:
+                    db.close()
+
+        results = await asyncio.gather(*(_refresh(location_id) for location_id in location_ids))
+        refreshed = sum(results)
+        if location_ids:
+            logger.info(f"Weather prefetch refreshed {refreshed}/{len(location_ids)} locations")
+        return refreshed
+
+
+def prefetch_enabled() -> bool:
+    if os.getenv("WEATHER_PREFETCH_ENABLED", "true").lower() not in ("1", "true"):
+        return False
+    return bool(os.getenv("GOOGLE_WEATHER_API_KEY") or os.getenv("GOOGLE_MAPS_API_KEY"))
@@ -1,3 +1,12 @@
 from fastapi import APIRouter
 
-router = APIRouter(prefix="/api/weather", tags=["Weather"])
\ No newline at end of file
+from weather_data.schemas import WeatherApiStatusSchema
+from weather_data.services import weather_api_status
+
+router = APIRouter(prefix="/api/weather", tags=["Weather"])
+
+
+@router.get("/status", response_model=WeatherApiStatusSchema)
+def get_weather_api_status():
+    """Circuit breaker state and negative-cache size for the Google Weather integration."""
+    return weather_api_status()
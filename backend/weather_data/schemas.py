@@ -1,5 +1,5 @@
 from datetime import date
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -16,3 +16,28 @@ class WeatherDataSchema(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+
+class CircuitBreakerTransitionSchema(BaseModel):
+    from_state: str
+    to_state: str
+    at: float
+
+
+class CircuitBreakerSchema(BaseModel):
+    name: str
+    state: str
+    consecutive_failures: int
+    failure_threshold: int
+    reset_timeout: float
+    retry_in: Optional[float] = None
+    total_failures: int
+    total_successes: int
+    total_rejected: int
+    transitions: List[CircuitBreakerTransitionSchema]
+
+
+class WeatherApiStatusSchema(BaseModel):
+    breaker: CircuitBreakerSchema
+    negative_cache_entries: int
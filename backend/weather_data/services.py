@@ -1,15 +1,108 @@
+import asyncio
+import json
 import logging
 import os
-from datetime import date
+import time
+from datetime import date, datetime, timedelta, timezone
 
-import httpx
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from http_clients import get_http_clients
+from location import geohash
 from location.models import Location
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 
 from weather_data.models import WeatherData
 
 
 GOOGLE_WEATHER_URL = "https://weather.googleapis.com/v1/forecast/days:lookup"
+FORECAST_HORIZON_DAYS = 10
+FORECAST_COLUMNS = (
+    "temperature_avg",
+    "temperature_min",
+    "temperature_max",
+    "humidity",
+    "weather_condition",
+    "raw_response_json",
+    "fetched_at",
+    "geo_bucket",
+)
+
+# Forecasts for today/tomorrow move more than those a week out, so they expire sooner.
+DEFAULT_WEATHER_CACHE_TTL_SECONDS = 6 * 60 * 60
+DEFAULT_WEATHER_CACHE_NEAR_TTL_SECONDS = 60 * 60
+NEAR_FORECAST_DAYS = 1
+
+# Locations whose coordinates fall in the same geohash cell share cached forecasts.
+DEFAULT_WEATHER_GEOHASH_PRECISION = 5
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+weather_breaker = CircuitBreaker(
+    "google_weather",
+    failure_threshold=env_int("WEATHER_BREAKER_FAILURE_THRESHOLD", 5),
+    reset_timeout=env_int("WEATHER_BREAKER_RESET_SECONDS", 30),
+)
+
+# (geo_bucket, forecast_date) -> monotonic expiry for lookups known to return no forecast.
+_negative_cache: dict[tuple[str, date], float] = {}
+DEFAULT_WEATHER_NEGATIVE_CACHE_SECONDS = 5 * 60
+
+
+def _is_known_missing(geo_bucket: str, target_date: date) -> bool:
+    expires_at = _negative_cache.get((geo_bucket, target_date))
+    if expires_at is None:
+        return False
+    if expires_at <= time.monotonic():
+        del _negative_cache[(geo_bucket, target_date)]
+        return False
+    return True
+
+
+def _remember_missing(geo_bucket: str, target_date: date) -> None:
+    ttl = env_int("WEATHER_NEGATIVE_CACHE_SECONDS", DEFAULT_WEATHER_NEGATIVE_CACHE_SECONDS)
+    _negative_cache[(geo_bucket, target_date)] = time.monotonic() + ttl
+
+
+def weather_api_status() -> dict:
+    now = time.monotonic()
+    return {
+        "breaker": weather_breaker.snapshot(),
+        "negative_cache_entries": sum(1 for expires_at in _negative_cache.values() if expires_at > now),
+    }
+
+
+def _cache_ttl(target_date: date) -> timedelta:
+    days_ahead = (target_date - date.today()).days
+    if days_ahead <= NEAR_FORECAST_DAYS:
+        return timedelta(seconds=env_int("WEATHER_CACHE_NEAR_TTL_SECONDS", DEFAULT_WEATHER_CACHE_NEAR_TTL_SECONDS))
+    return timedelta(seconds=env_int("WEATHER_CACHE_TTL_SECONDS", DEFAULT_WEATHER_CACHE_TTL_SECONDS))
+
+
+def geo_bucket_for(location: Location) -> str:
+    precision = env_int("WEATHER_GEOHASH_PRECISION", DEFAULT_WEATHER_GEOHASH_PRECISION)
+    return geohash.encode(location.latitude, location.longitude, precision)
+
+
+def _is_fresh(weather: WeatherData, target_date: date) -> bool:
+    """Return True when a stored row came from the API and is still within its TTL."""
+    if not weather.raw_response_json or weather.fetched_at is None:
+        return False
+
+    # Past dates can no longer be fetched, so whatever we stored is final.
+    if target_date < date.today():
+        return True
+
+    fetched_at = weather.fetched_at
+    if fetched_at.tzinfo is None:
+        fetched_at = fetched_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - fetched_at < _cache_ttl(target_date)
 
 
 def _extract_condition_text(forecast_day: dict) -> str:
@@ -35,94 +128,184 @@ def _extract_humidity(forecast_day: dict) -> float:
     return 50.0
 
 
-def _find_forecast_day(forecast_days: list[dict], target_date: date) -> dict | None:
-    for forecast_day in forecast_days:
-        display_date = forecast_day.get("displayDate") or {}
-        if (
-            display_date.get("year") == target_date.year
-            and display_date.get("month") == target_date.month
-            and display_date.get("day") == target_date.day
-        ):
-            return forecast_day
-    return None
+def _forecast_date(forecast_day: dict) -> date | None:
+    display_date = forecast_day.get("displayDate") or {}
+    try:
+        return date(display_date["year"], display_date["month"], display_date["day"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _forecast_row(location_id: int, geo_bucket: str, forecast_day: dict, fetched_at: datetime) -> dict | None:
+    forecast_date = _forecast_date(forecast_day)
+    temperature_max = (forecast_day.get("maxTemperature") or {}).get("degrees")
+    temperature_min = (forecast_day.get("minTemperature") or {}).get("degrees")
+    if forecast_date is None or temperature_max is None or temperature_min is None:
+        return None
+
+    return {
+        "location_id": location_id,
+        "forecast_date": forecast_date,
+        "temperature_avg": (temperature_max + temperature_min) / 2,
+        "temperature_min": temperature_min,
+        "temperature_max": temperature_max,
+        "humidity": _extract_humidity(forecast_day),
+        "weather_condition": _extract_condition_text(forecast_day),
+        # Keep each row self-contained so it can be served without the rest of the response.
+        "raw_response_json": json.dumps({"forecastDays": [forecast_day]}),
+        "fetched_at": fetched_at,
+        "geo_bucket": geo_bucket,
+    }
+
+
+def _upsert_forecast_rows(db: Session, rows: list[dict]) -> None:
+    """Insert or refresh every forecast day in a single statement."""
+    statement = sqlite_insert(WeatherData).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[WeatherData.location_id, WeatherData.forecast_date],
+        set_={column: statement.excluded[column] for column in FORECAST_COLUMNS},
+    )
+    db.execute(statement)
+    db.commit()
+
+
+def _weather_api_key() -> str:
+    api_key = os.getenv("GOOGLE_WEATHER_API_KEY") or os.getenv("GOOGLE_MAPS_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_WEATHER_API_KEY (or GOOGLE_MAPS_API_KEY) environment variable is missing.")
+    return api_key
+
+
+async def _fetch_and_store_forecast(db: Session, location: Location, geo_bucket: str, api_key: str) -> list[dict]:
+    # Always ask for the full horizon; every returned day is stored for later lookups.
+    params = {
+        "key": api_key,
+        "location.latitude": location.latitude,
+        "location.longitude": location.longitude,
+        "days": FORECAST_HORIZON_DAYS,
+        "pageSize": FORECAST_HORIZON_DAYS,
+        "languageCode": "en-US",
+        "unitsSystem": "METRIC",
+    }
+
+    if not weather_breaker.allow_request():
+        raise CircuitOpenError("Weather API circuit is open")
+
+    try:
+        response = await get_http_clients().request("weather", "GET", GOOGLE_WEATHER_URL, params=params)
+        response.raise_for_status()
+        data = response.json()
+    except asyncio.CancelledError:
+        # A disconnected client or shutdown says nothing about the Weather API
+        weather_breaker.record_cancelled()
+        raise
+    except Exception:
+        weather_breaker.record_failure()
+        raise
+    weather_breaker.record_success()
+
+    fetched_at = datetime.now(timezone.utc)
+    rows = [
+        row
+        for row in (_forecast_row(location.id, geo_bucket, forecast_day, fetched_at) for forecast_day in data.get("forecastDays", []))
+        if row is not None
+    ]
+    if rows:
+        _upsert_forecast_rows(db, rows)
+    return rows
+
+
+def forecast_needs_refresh(db: Session, location: Location, within: timedelta = timedelta(0)) -> bool:
+    """Return True when the location's bucket has no forecast for today that stays fresh for `within`."""
+    today = date.today()
+    latest = db.query(WeatherData).filter(
+        WeatherData.geo_bucket == geo_bucket_for(location),
+        WeatherData.forecast_date == today,
+        WeatherData.raw_response_json.isnot(None),
+    ).order_by(WeatherData.fetched_at.desc()).first()
+    if latest is None or latest.fetched_at is None:
+        return True
+
+    fetched_at = latest.fetched_at
+    if fetched_at.tzinfo is None:
+        fetched_at = fetched_at.replace(tzinfo=timezone.utc)
+    return fetched_at + _cache_ttl(today) <= datetime.now(timezone.utc) + within
+
+
+async def refresh_forecast(db: Session, location: Location) -> int:
+    """Fetch and store the full forecast horizon for a location. Returns the number of days stored."""
+    rows = await _fetch_and_store_forecast(db, location, geo_bucket_for(location), _weather_api_key())
+    return len(rows)
 
 
 async def get_or_fetch_weather(db: Session, location: Location, target_date: date) -> WeatherData:
+    geo_bucket = geo_bucket_for(location)
+    shared = db.query(WeatherData).filter(
+        WeatherData.geo_bucket == geo_bucket,
+        WeatherData.forecast_date == target_date,
+        WeatherData.raw_response_json.isnot(None),
+    ).order_by(WeatherData.fetched_at.desc()).first()
+
+    if shared is not None and _is_fresh(shared, target_date):
+        shared._using_defaults = False
+        return shared
+
     weather = db.query(WeatherData).filter(
         WeatherData.location_id == location.id,
         WeatherData.forecast_date == target_date,
     ).first()
 
+    if weather is not None and _is_fresh(weather, target_date):
+        weather._using_defaults = False
+        return weather
+
     logger = logging.getLogger(__name__)
-    api_key = os.getenv("GOOGLE_WEATHER_API_KEY") or os.getenv("GOOGLE_MAPS_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_WEATHER_API_KEY (or GOOGLE_MAPS_API_KEY) environment variable is missing.")
+    api_key = _weather_api_key()
 
-    using_defaults = False
     try:
         days_ahead = (target_date - date.today()).days
-        if days_ahead < 0 or days_ahead > 9:
+        if days_ahead < 0 or days_ahead >= FORECAST_HORIZON_DAYS:
             raise ValueError("Google Weather API supports daily forecast lookup for the next 10 days only.")
+        if _is_known_missing(geo_bucket, target_date):
+            raise ValueError("Weather API recently returned no forecast for the requested date")
 
-        params = {
-            "key": api_key,
-            "location.latitude": location.latitude,
-            "location.longitude": location.longitude,
-            "days": days_ahead + 1,
-            "pageSize": days_ahead + 1,
-            "languageCode": "en-US",
-            "unitsSystem": "METRIC",
-        }
-
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(GOOGLE_WEATHER_URL, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            forecast_day = _find_forecast_day(data.get("forecastDays", []), target_date)
-            if not forecast_day:
-                raise ValueError("No daily forecast data returned for the requested date")
-
-            max_temperature = forecast_day.get("maxTemperature") or {}
-            min_temperature = forecast_day.get("minTemperature") or {}
-            temperature_max = max_temperature.get("degrees")
-            temperature_min = min_temperature.get("degrees")
-            if temperature_max is None or temperature_min is None:
-                raise ValueError("Weather API response missing min/max temperature")
-
-            temperature_avg = (temperature_max + temperature_min) / 2
-
-            humidity = _extract_humidity(forecast_day)
-            condition = _extract_condition_text(forecast_day)
-
-            raw_response_json = response.text
+        rows = await _fetch_and_store_forecast(db, location, geo_bucket, api_key)
+        if not any(row["forecast_date"] == target_date for row in rows):
+            _remember_missing(geo_bucket, target_date)
+            raise ValueError("No daily forecast data returned for the requested date")
     except Exception as exc:
         logger.warning(f"Weather API failed, using defaults: {exc}")
 
-        if weather and weather.raw_response_json and "forecastDays" in weather.raw_response_json:
+        for stale in (weather, shared):
+            if stale and stale.raw_response_json and "forecastDays" in stale.raw_response_json:
+                stale._using_defaults = True
+                return stale
+
+        # Already holding defaults for this date; nothing to write.
+        if weather is not None and weather.raw_response_json is None:
             weather._using_defaults = True
             return weather
 
-        temperature_max = 28.0
-        temperature_min = 22.0
-        temperature_avg = 25.0
-        humidity = 50.0
-        condition = "Clear"
-        raw_response_json = None
-        using_defaults = True
-
-    if weather is None:
-        weather = WeatherData(location_id=location.id, forecast_date=target_date)
-        db.add(weather)
-
-    weather.temperature_avg = temperature_avg
-    weather.temperature_min = temperature_min
-    weather.temperature_max = temperature_max
-    weather.humidity = humidity
-    weather.weather_condition = condition
-    weather.raw_response_json = raw_response_json
+        if weather is None:
+            weather = WeatherData(location_id=location.id, forecast_date=target_date)
+            db.add(weather)
 
-    db.commit()
-    db.refresh(weather)
-    weather._using_defaults = using_defaults
+        weather.temperature_avg = 25.0
+        weather.temperature_min = 22.0
+        weather.temperature_max = 28.0
+        weather.humidity = 50.0
+        weather.weather_condition = "Clear"
+        weather.raw_response_json = None
+        weather.fetched_at = datetime.now(timezone.utc)
+
+        db.commit()
+        db.refresh(weather)
+        weather._using_defaults = True
+        return weather
+
+    weather = db.query(WeatherData).filter(
+        WeatherData.location_id == location.id,
+        WeatherData.forecast_date == target_date,
+    ).one()
+    weather._using_defaults = False
     return weather
@@ -260,7 +260,7 @@ export default function MyWardrobe() {
       });
 
       if (res.ok) {
-        const updatedItems = await res.json();
+        const { items: updatedItems, results, failed } = await res.json();
 
         // Update local state for each updated item
         setWardrobe((prev) => {
@@ -287,7 +287,21 @@ export default function MyWardrobe() {
           return next;
         });
 
-        setSelectedItems([]); // Clear selection after processing
+        if (failed > 0) {
+          const failures = results
+            .filter((r) => r.status !== "processed")
+            .map((r) => `#${r.item_id}: ${r.error || r.status}`)
+            .join("\n");
+          alert(
+            `Background removed for ${updatedItems.length} item(s), ${failed} failed:\n${failures}`,
+          );
+          // Keep the failed items selected so they can be retried
+          setSelectedItems(
+            results.filter((r) => r.status !== "processed").map((r) => r.item_id),
+          );
+        } else {
+          setSelectedItems([]); // Clear selection after processing
+        }
       } else {
         console.error("Batch processing failed");
       }
@@ -347,7 +361,7 @@ export default function MyWardrobe() {
       });
 
       if (res.ok) {
-        const updatedItems = await res.json();
+        const { items: updatedItems, results, failed } = await res.json();
 
         // Update local state with AI-analyzed items
         setWardrobe((prev) => {
@@ -363,8 +377,22 @@ export default function MyWardrobe() {
           return next;
         });
 
-        alert(`✓ AI analysis complete for ${updatedItems.length} item(s)!`);
-        setSelectedItems([]);
+        if (failed > 0) {
+          const failures = results
+            .filter((r) => r.status !== "analyzed")
+            .map((r) => `#${r.item_id}: ${r.error || r.status}`)
+            .join("\n");
+          alert(
+            `AI analysis complete for ${updatedItems.length} item(s), ${failed} failed:\n${failures}`,
+          );
+          // Keep the failed items selected so they can be retried
+          setSelectedItems(
+            results.filter((r) => r.status !== "analyzed").map((r) => r.item_id),
+          );
+        } else {
+          alert(`✓ AI analysis complete for ${updatedItems.length} item(s)!`);
+          setSelectedItems([]);
+        }
       } else {
         const err = await res.json().catch(() => ({}));
         alert("AI analysis failed: " + (err.detail || "Unknown error"));